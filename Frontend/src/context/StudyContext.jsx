@@ -6,6 +6,7 @@ const StudyContext = createContext();
 export const StudyProvider = ({ children }) => {
     const [text, setText] = useState(null);
     const [fileName, setFileName] = useState(null);
+    const [docId, setDocId] = useState(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
 
@@ -14,6 +15,7 @@ export const StudyProvider = ({ children }) => {
     const [quiz, setQuiz] = useState(null);
     const [flashcards, setFlashcards] = useState(null);
     const [chatHistory, setChatHistory] = useState([]);
+    const [chatSessionId, setChatSessionId] = useState(null);
 
     const uploadFile = async (file) => {
         setLoading(true);
@@ -28,12 +30,14 @@ export const StudyProvider = ({ children }) => {
 
             if (res.data.text) {
                 setText(res.data.text);
+                setDocId(res.data.doc_id || null);
                 setFileName(file.name);
                 // Clear previous contexts when a new file is uploaded
                 setSummary(null);
                 setQuiz(null);
                 setFlashcards(null);
                 setChatHistory([]);
+                setChatSessionId(null);
             } else {
                 throw new Error("No text returned from server.");
             }
@@ -44,22 +48,38 @@ export const StudyProvider = ({ children }) => {
         }
     };
 
+    // Sends the doc_id instead of the full text; falls back to the text
+    // if this server instance no longer has the document stored.
+    const postWithDocument = async (url, body = {}) => {
+        if (docId) {
+            try {
+                return await axios.post(url, { ...body, doc_id: docId });
+            } catch (err) {
+                if (err.response?.status !== 404) throw err;
+            }
+        }
+        return axios.post(url, { ...body, text });
+    };
+
     const clearFile = () => {
         setText(null);
+        setDocId(null);
         setFileName(null);
         setSummary(null);
         setQuiz(null);
         setFlashcards(null);
         setChatHistory([]);
+        setChatSessionId(null);
     };
 
     return (
         <StudyContext.Provider value={{
-            text, fileName, loading, error, uploadFile, clearFile,
+            text, fileName, loading, error, uploadFile, clearFile, postWithDocument,
             summary, setSummary,
             quiz, setQuiz,
             flashcards, setFlashcards,
-            chatHistory, setChatHistory
+            chatHistory, setChatHistory,
+            chatSessionId, setChatSessionId
         }}>
             {children}
         </StudyContext.Provider>
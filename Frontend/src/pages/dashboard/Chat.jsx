@@ -1,11 +1,12 @@
 import { useState, useRef, useEffect } from 'react';
 import { useStudy } from '../../context/StudyContext';
-import axios from 'axios';
 import { Send, User, Bot, Loader2, UploadCloud } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
+const RESEED_MESSAGES = 6;
+
 const Chat = () => {
-    const { text, fileName, chatHistory: messages, setChatHistory: setMessages } = useStudy();
+    const { text, fileName, postWithDocument, chatHistory: messages, setChatHistory: setMessages, chatSessionId, setChatSessionId } = useStudy();
     const [input, setInput] = useState('');
     const [loading, setLoading] = useState(false);
     const messagesEndRef = useRef(null);
@@ -27,19 +28,19 @@ const Chat = () => {
         setLoading(true);
 
         try {
-            // Send history + current query + text context
-            // Backend expects history as specific format
-            // Limit history sent?
-            const historyPayload = messages.map(m => ({
+            // The server keeps the conversation per session; the last few
+            // messages are only used to reseed it if the session was lost.
+            const historyPayload = messages.slice(-RESEED_MESSAGES).map(m => ({
                 role: m.role,
                 content: m.content
-            })); // simplified
+            }));
 
-            const res = await axios.post('/api/chat', {
-                text: text,
+            const res = await postWithDocument('/api/chat', {
                 query: userMessage.content,
-                history: historyPayload
+                history: historyPayload,
+                session_id: chatSessionId
             });
+            setChatSessionId(res.data.session_id);
 
             const botMessage = { role: 'ai', content: res.data.answer };
             setMessages(prev => [...prev, botMessage]);
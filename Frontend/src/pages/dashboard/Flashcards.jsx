@@ -1,11 +1,10 @@
 import { useState } from 'react';
 import { useStudy } from '../../context/StudyContext';
-import axios from 'axios';
 import { Layers, RotateCw, ChevronLeft, ChevronRight, UploadCloud } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
 const Flashcards = () => {
-    const { text, fileName, flashcards, setFlashcards } = useStudy();
+    const { text, fileName, postWithDocument, flashcards, setFlashcards } = useStudy();
     const [currentIndex, setCurrentIndex] = useState(0);
     const [isFlipped, setIsFlipped] = useState(false);
     const [loading, setLoading] = useState(false);
@@ -22,7 +21,7 @@ const Flashcards = () => {
         if (!text) return;
         setLoading(true);
         try {
-            const res = await axios.post('/api/flashcards', { text });
+            const res = await postWithDocument('/api/flashcards');
             if (res.data.flashcards) {
                 setFlashcards(res.data.flashcards);
                 setStarted(true);
@@ -1,11 +1,10 @@
 import { useState } from 'react';
 import { useStudy } from '../../context/StudyContext';
-import axios from 'axios';
 import { CheckCircle, XCircle, Trophy, BarChart, RefreshCw, UploadCloud, BrainCircuit } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
 const Quiz = () => {
-    const { text, fileName, quiz: mcqs, setQuiz: setMcqs } = useStudy();
+    const { text, fileName, postWithDocument, quiz: mcqs, setQuiz: setMcqs } = useStudy();
     const [current, setCurrent] = useState(0);
     const [selected, setSelected] = useState(null);
     const [score, setScore] = useState(0);
@@ -25,7 +24,7 @@ const Quiz = () => {
         if (!text) return;
         setLoading(true);
         try {
-            const res = await axios.post('/api/mcq', { text });
+            const res = await postWithDocument('/api/mcq');
             if (res.data.mcqs) {
                 setMcqs(res.data.mcqs);
                 setQuizStarted(true);
@@ -1,6 +1,5 @@
 import { useState } from 'react';
 import { useStudy } from '../../context/StudyContext';
-import axios from 'axios';
 import { UploadCloud, CheckCircle, FileText, Loader2, Download, Trash2, Copy, Zap } from 'lucide-react';
 import { motion } from 'framer-motion';
 import ReactMarkdown from 'react-markdown';
@@ -9,7 +8,7 @@ import { jsPDF } from 'jspdf';
 import { toast } from 'react-hot-toast';
 
 const Summarize = () => {
-    const { text, fileName, uploadFile, loading: extractLoading, error: extractError, clearFile, summary, setSummary } = useStudy();
+    const { text, fileName, postWithDocument, uploadFile, loading: extractLoading, error: extractError, clearFile, summary, setSummary } = useStudy();
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
 
@@ -25,7 +24,7 @@ const Summarize = () => {
         setLoading(true);
         setError(null);
         try {
-            const res = await axios.post('/api/summarize', { text });
+            const res = await postWithDocument('/api/summarize');
             setSummary(res.data.summary);
             toast.success("Summary generated!");
         } catch (err) {
@@ -1,20 +1,55 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Header, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartParser
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
+import hashlib
+import json
+import math
 import os
-import shutil
-import tempfile
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Local runs read settings from .env; on Vercel they are already in the environment
+if not os.environ.get("VERCEL"):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Import utilities
 try:
-    from .utils import extract_text, get_gemini_text, get_gemini_json
+    from .utils import extract_sections, get_gemini_text_async, get_gemini_json_async, stream_gemini_text, stream_gemini_json_items
+    from .response_cache import get_response_cache
+    from .singleflight import generation_flight
+    from .quota import QuotaExceeded, quota_governor
+    from .resilience import resilience
+    from .circuit_breaker import CircuitOpen, breakers
+    from .router import current_endpoint, endpoint_for_path, model_router
+    from .doc_store import get_doc_store
+    from .extraction_cache import get_extraction_cache
+    from .summarizer import prepare_summary_context
+    from .tokens import estimate_tokens, token_budget, token_estimator
+    from .retrieval import build_indexes, retrieve_context
+    from .chat_sessions import chat_sessions
+    from .prompts import SUMMARIZE_INSTRUCTION, MCQ_INSTRUCTION, FLASHCARDS_INSTRUCTION, chat_instruction
+    from .study_pack import build_study_pack, iter_study_pack
+    from .schemas import FLASHCARD_LIST, MCQ_LIST
 except ImportError:
-    from utils import extract_text, get_gemini_text, get_gemini_json
+    from utils import extract_sections, get_gemini_text_async, get_gemini_json_async, stream_gemini_text, stream_gemini_json_items
+    from response_cache import get_response_cache
+    from singleflight import generation_flight
+    from quota import QuotaExceeded, quota_governor
+    from resilience import resilience
+    from circuit_breaker import CircuitOpen, breakers
+    from router import current_endpoint, endpoint_for_path, model_router
+    from doc_store import get_doc_store
+    from extraction_cache import get_extraction_cache
+    from summarizer import prepare_summary_context
+    from tokens import estimate_tokens, token_budget, token_estimator
+    from retrieval import build_indexes, retrieve_context
+    from chat_sessions import chat_sessions
+    from prompts import SUMMARIZE_INSTRUCTION, MCQ_INSTRUCTION, FLASHCARDS_INSTRUCTION, chat_instruction
+    from study_pack import build_study_pack, iter_study_pack
+    from schemas import FLASHCARD_LIST, MCQ_LIST
 
 app = FastAPI()
 
@@ -26,14 +61,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def route_by_endpoint(request: Request, call_next):
+    # Tells the model router which latency target (ROUTER_TARGETS) this request's generations have
+    token = current_endpoint.set(endpoint_for_path(request.url.path))
+    try:
+        return await call_next(request)
+    finally:
+        current_endpoint.reset(token)
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "retry_after": round(exc.retry_after, 1)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open(request: Request, exc: CircuitOpen):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "retry_after": round(exc.retry_after, 1)},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
 # --- Pydantic Models ---
+# Generation requests carry either the full text or a doc_id from /api/extract-text
 class TextRequest(BaseModel):
-    text: str
+    text: Optional[str] = None
+    doc_id: Optional[str] = None
 
 class ChatRequest(BaseModel):
-    text: str
+    text: Optional[str] = None
+    doc_id: Optional[str] = None
     query: str
     history: List[dict] = []
+    # Server-side conversation; history only seeds a session the server does not know
+    session_id: Optional[str] = None
+
+class StudyPackRequest(TextRequest):
+    # single: one structured prompt; concurrent: three parallel calls; auto picks by document size
+    mode: Literal["auto", "single", "concurrent"] = "auto"
+
+def resolve_text(request) -> str:
+    """Returns the inline text, or loads it from the document store by doc_id."""
+    if request.text:
+        return request.text
+    if not request.doc_id:
+        raise HTTPException(status_code=400, detail="Provide either text or doc_id")
+    text = get_doc_store().get(request.doc_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Unknown doc_id; upload the document again")
+    return text
+
+def cache_enabled(
+    cache_control: Optional[str] = Header(None),
+    x_cache_bypass: Optional[str] = Header(None),
+) -> bool:
+    """False when the client asks for a fresh generation (X-Cache-Bypass or Cache-Control: no-cache)."""
+    if x_cache_bypass and x_cache_bypass.lower() not in ("0", "false", "no"):
+        return False
+    return not (cache_control and "no-cache" in cache_control.lower())
+
+def _error_payload(error: Exception) -> dict:
+    payload = {"detail": str(error)}
+    if isinstance(error, (QuotaExceeded, CircuitOpen)):
+        payload["retry_after"] = round(error.retry_after, 1)
+    return payload
+
+def _text_event(chunk: str):
+    return None, {"text": chunk}
+
+def sse_response(http_request: Request, chunks, to_event=_text_event) -> StreamingResponse:
+    """
+    Forwards an async iterator as Server-Sent Events, stopping upstream when the
+    client leaves. to_event maps each item to (event name or None, JSON payload).
+    """
+    async def events():
+        try:
+            async for chunk in chunks:
+                if await http_request.is_disconnected():
+                    break
+                event, payload = to_event(chunk)
+                prefix = f"event: {event}\n" if event else ""
+                yield f"{prefix}data: {json.dumps(payload)}\n\n"
+            else:
+                yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(_error_payload(e))}\n\n"
+        finally:
+            # Closing the generator cancels the upstream Gemini stream
+            await chunks.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def ndjson_response(http_request: Request, items) -> StreamingResponse:
+    """
+    Forwards an async iterator as newline-delimited JSON, one item per line,
+    stopping upstream when the client leaves. A failure ends the stream with
+    an {"error": ...} line.
+    """
+    async def lines():
+        try:
+            async for item in items:
+                if await http_request.is_disconnected():
+                    break
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            payload = _error_payload(e)
+            yield json.dumps({"error": payload.pop("detail"), **payload}) + "\n"
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/")
 async def root():
@@ -47,58 +196,190 @@ async def health():
         "key_preview": os.environ.get("GOOGLE_API_KEY", "")[:5] + "..." if os.environ.get("GOOGLE_API_KEY") else "None"
     }
 
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "response_cache": get_response_cache().snapshot(),
+        "single_flight": generation_flight.snapshot(),
+        "doc_store": get_doc_store().snapshot(),
+        "extraction_cache": get_extraction_cache().snapshot(),
+        "chat_sessions": chat_sessions.snapshot(),
+        "quota": quota_governor.snapshot(),
+        "resilience": resilience.snapshot(),
+        "circuit_breakers": breakers.snapshot(),
+        "router": model_router.snapshot(),
+        "tokens": token_estimator.snapshot(),
+    }
+
+# Uploads are hashed in chunks of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Uploads up to this size are extracted straight from memory; larger ones spill to a temp file
+UPLOAD_MEMORY_BYTES = int(os.environ.get("UPLOAD_MEMORY_BYTES", str(32 * 1024 * 1024)))
+# Starlette spools each upload itself (1 MiB in memory by default); extraction reads that file directly
+MultiPartParser.spool_max_size = UPLOAD_MEMORY_BYTES
+
 @app.post("/api/extract-text")
 async def api_extract_text(file: UploadFile = File(...)):
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in [".pdf", ".docx", ".txt", ".md"]:
         raise HTTPException(status_code=400, detail="Unsupported file format")
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        temp_path = buffer.name
-        
     try:
-        text = extract_text(temp_path)
-        os.remove(temp_path)
-        if not text:
-            raise HTTPException(status_code=500, detail="Failed to extract text or empty file")
-        return {"text": text, "filename": file.filename}
+        # Hash first so repeat uploads can skip parsing entirely
+        digest = hashlib.sha256()
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            size += len(chunk)
+        await file.seek(0)
+
+        cache = get_extraction_cache()
+        cache_key = cache.key(digest.hexdigest(), ext)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            text, page_offsets = cached["text"], cached["page_offsets"]
+        else:
+            sections = await run_in_threadpool(extract_sections, file.file, ext)
+            text = "".join(sections)
+            if not text:
+                raise HTTPException(status_code=500, detail="Failed to extract text or empty file")
+            page_offsets = []
+            offset = 0
+            for section in sections:
+                page_offsets.append(offset)
+                offset += len(section)
+            cache.set(cache_key, text, page_offsets, {"ext": ext, "size": size, "sections": len(sections)})
+        doc_id = get_doc_store().put(text)
+        # Build the chat retrieval index now so the first question does not pay for it
+        await run_in_threadpool(build_indexes, text, doc_id)
+        return {"text": text, "filename": file.filename, "doc_id": doc_id, "page_offsets": page_offsets}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _document_context(request: TextRequest, use_cache: bool) -> str:
+    """The request's document, map-reduced first if it exceeds the endpoint's input budget."""
+    try:
+        return await prepare_summary_context(resolve_text(request), use_cache)
+    except HTTPException:
+        raise
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        if os.path.exists(temp_path): os.remove(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/summarize")
-async def summarize(request: TextRequest):
+async def summarize(request: TextRequest, use_cache: bool = Depends(cache_enabled)):
+    text = resolve_text(request)
     try:
-        instruction = "Summarize the following text professionally. Use clear headings, bullet points, and bold key terms."
-        summary = get_gemini_text(request.text, instruction)
+        # Long documents are map-reduced into section summaries first
+        context = await prepare_summary_context(text, use_cache)
+        summary = await get_gemini_text_async(context, SUMMARIZE_INSTRUCTION, use_cache)
+        if summary.startswith("Error:"):
+            raise RuntimeError(summary)
         return {"summary": summary}
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/summarize/stream")
+async def summarize_stream(request: TextRequest, http_request: Request, use_cache: bool = Depends(cache_enabled)):
+    context = await _document_context(request, use_cache)
+    return sse_response(http_request, stream_gemini_text(context, SUMMARIZE_INSTRUCTION, use_cache))
+
 @app.post("/api/mcq")
-async def generate_mcqs(request: TextRequest):
+async def generate_mcqs(request: TextRequest, use_cache: bool = Depends(cache_enabled)):
+    context = await _document_context(request, use_cache)
     try:
-        instruction = "Generate 10 multiple choice questions. Return ONLY a JSON list: [{\"question\": \"...\", \"options\": [\"...\", \"...\", \"...\"], \"answer\": 0}]"
-        mcqs = get_gemini_json(request.text, instruction)
+        mcqs = await get_gemini_json_async(context, MCQ_INSTRUCTION, use_cache, MCQ_LIST)
         return {"mcqs": mcqs}
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/flashcards")
-async def generate_flashcards(request: TextRequest):
+async def generate_flashcards(request: TextRequest, use_cache: bool = Depends(cache_enabled)):
+    context = await _document_context(request, use_cache)
     try:
-        instruction = "Generate 10 flashcards. Return ONLY a JSON list: [{\"front\": \"...\", \"back\": \"...\"}]"
-        flashcards = get_gemini_json(request.text, instruction)
+        flashcards = await get_gemini_json_async(context, FLASHCARDS_INSTRUCTION, use_cache, FLASHCARD_LIST)
         return {"flashcards": flashcards}
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/mcq/stream")
+async def generate_mcqs_stream(request: TextRequest, http_request: Request, use_cache: bool = Depends(cache_enabled)):
+    context = await _document_context(request, use_cache)
+    return ndjson_response(http_request, stream_gemini_json_items(context, MCQ_INSTRUCTION, MCQ_LIST, use_cache))
+
+@app.post("/api/flashcards/stream")
+async def generate_flashcards_stream(request: TextRequest, http_request: Request, use_cache: bool = Depends(cache_enabled)):
+    context = await _document_context(request, use_cache)
+    return ndjson_response(
+        http_request, stream_gemini_json_items(context, FLASHCARDS_INSTRUCTION, FLASHCARD_LIST, use_cache)
+    )
+
+@app.post("/api/study-pack")
+async def study_pack(request: StudyPackRequest, use_cache: bool = Depends(cache_enabled)):
+    text = resolve_text(request)
+    try:
+        return await build_study_pack(text, use_cache, request.mode)
+    except (QuotaExceeded, CircuitOpen):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/study-pack/stream")
+async def study_pack_stream(request: StudyPackRequest, http_request: Request, use_cache: bool = Depends(cache_enabled)):
+    # Streaming defaults to concurrent generation so each artifact arrives on its own
+    mode = "concurrent" if request.mode == "auto" else request.mode
+    artifacts = iter_study_pack(resolve_text(request), use_cache, mode)
+    return sse_response(http_request, artifacts, to_event=lambda item: item)
+
+def _chat_context_tokens(instruction: str) -> int:
+    """What is left of the chat input budget for document passages once the question and history are in."""
+    return max(1, token_budget().input - estimate_tokens(instruction))
+
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, use_cache: bool = Depends(cache_enabled)):
+    text = resolve_text(request)
+    session = chat_sessions.get_or_create(request.session_id, request.history)
     try:
-        instruction = f"User Question: {request.query}\nAnswer based contextually on the provided text."
-        response = get_gemini_text(request.text, instruction)
-        return {"answer": response}
+        await chat_sessions.ensure_budget(session)
+        instruction = chat_instruction(request.query, session.history_block())
+        context = await run_in_threadpool(retrieve_context, text, request.query, max_tokens=_chat_context_tokens(instruction))
+        response = await get_gemini_text_async(context, instruction, use_cache)
+        if response.startswith("Error:"):
+            raise RuntimeError(response)
+        session.add_turn(request.query, response)
+        chat_sessions.schedule_compaction(session)
+        return {"answer": response, "session_id": session.id}
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _record_turn(chunks, session, query: str):
+    """Passes chunks through and stores the finished answer in the chat session."""
+    parts = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        session.add_turn(query, "".join(parts).strip())
+        chat_sessions.schedule_compaction(session)
+    finally:
+        await chunks.aclose()
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request, use_cache: bool = Depends(cache_enabled)):
+    text = resolve_text(request)
+    session = chat_sessions.get_or_create(request.session_id, request.history)
+    await chat_sessions.ensure_budget(session)
+    instruction = chat_instruction(request.query, session.history_block())
+    context = await run_in_threadpool(retrieve_context, text, request.query, max_tokens=_chat_context_tokens(instruction))
+    response = sse_response(http_request, _record_turn(stream_gemini_text(context, instruction, use_cache), session, request.query))
+    response.headers["X-Chat-Session"] = session.id
+    return response
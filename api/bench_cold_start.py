@@ -0,0 +1,115 @@
+"""
+Cold start benchmark: import cost of app.py and time to the first response.
+
+Each run starts a fresh interpreter with `python -X importtime`, imports the
+app, and serves GET /api/health straight through the ASGI interface (no
+server, no HTTP client). It reports the slowest imports by cumulative time,
+and fails when a budget is exceeded or a heavy dependency is imported
+eagerly again. That makes it usable as a CI gate against cold-start
+regressions.
+
+Usage: python bench_cold_start.py [--runs N] [--top N] [--max-import-ms MS] [--max-first-response-ms MS]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Must stay out of a cold start; each is imported by the endpoint that needs it
+LAZY_MODULES = ("google.generativeai", "pypdf", "docx", "numpy")
+
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+
+async def first_response():
+    messages = []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/health", "raw_path": b"/api/health", "root_path": "",
+        "query_string": b"", "headers": [], "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    await app.app(scope, receive, send)
+    return messages[0]["status"]
+
+status = asyncio.run(first_response())
+responded = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (responded - started) * 1000,
+    "status": status,
+    "lazy_loaded": [name for name in LAZY_MODULES if name in sys.modules],
+}))
+"""
+
+
+def _run_once() -> tuple:
+    """One cold start; returns (probe result, {module: cumulative import microseconds})."""
+    env = dict(os.environ, VERCEL="1", PYTHONDONTWRITEBYTECODE="1")
+    probe = f"LAZY_MODULES = {LAZY_MODULES!r}\n" + _PROBE
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True,
+    )
+    imports = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-response-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    results, imports = [], []
+    for _ in range(args.runs):
+        result, cumulative = _run_once()
+        results.append(result)
+        imports.append(cumulative)
+
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    first_ms = statistics.median(r["first_response_ms"] for r in results)
+    print(f"runs: {args.runs}")
+    print(f"import app (median):          {import_ms:8.1f} ms")
+    print(f"first response (median):      {first_ms:8.1f} ms")
+    print(f"health status:                {results[-1]['status']}")
+
+    # Median cumulative time of the modules app.py pulls in, slowest first
+    names = set().union(*imports)
+    medians = {name: statistics.median(run.get(name, 0) for run in imports) for name in names}
+    print(f"\n{'module':<40} {'cumulative (ms)':>16}")
+    for name, micros in sorted(medians.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40} {micros / 1000:>16.1f}")
+
+    failures = []
+    eager = sorted(set().union(*(r["lazy_loaded"] for r in results)))
+    if eager:
+        failures.append(f"imported during cold start: {', '.join(eager)}")
+    if any(r["status"] != 200 for r in results):
+        failures.append("GET /api/health did not return 200")
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.1f} ms (budget {args.max_import_ms:.1f} ms)")
+    if args.max_first_response_ms is not None and first_ms > args.max_first_response_ms:
+        failures.append(f"first response took {first_ms:.1f} ms (budget {args.max_first_response_ms:.1f} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
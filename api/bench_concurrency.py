@@ -0,0 +1,38 @@
+"""
+Concurrency benchmark for the async generation path.
+
+Swaps in the stub backend with a fixed latency, fires
+N overlapping /api/summarize handler calls and compares the wall time with a
+single call. With a non-blocking handler the two should be about equal.
+
+Usage: python bench_concurrency.py [requests] [latency_seconds]
+"""
+import asyncio
+import sys
+import time
+
+import app
+from llm_backends import StubBackend, set_backend
+
+
+async def _run(n: int) -> float:
+    # Distinct texts and no cache, so every call really reaches the backend
+    requests = [app.TextRequest(text=f"Photosynthesis converts light energy, part {i}.") for i in range(n)]
+    started = time.perf_counter()
+    await asyncio.gather(*(app.summarize(request, use_cache=False) for request in requests))
+    return time.perf_counter() - started
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    set_backend(StubBackend(latency=str(latency)))
+
+    single = asyncio.run(_run(1))
+    overlapped = asyncio.run(_run(n))
+    print(f"1 request:  {single:.3f}s")
+    print(f"{n} requests: {overlapped:.3f}s ({overlapped / single:.2f}x a single call)")
+
+
+if __name__ == "__main__":
+    main()
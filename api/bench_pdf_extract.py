@@ -0,0 +1,95 @@
+"""
+PDF extraction benchmark.
+
+Generates synthetic 10/100/1000-page PDFs and compares the old
+`text += page` loop with the join-based collector over iter_pdf_pages
+and with the page-sharded process pool (PDF_WORKERS processes).
+
+Usage: python bench_pdf_extract.py [page counts...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pypdf
+
+import utils
+
+
+def make_pdf(path: str, pages: int, lines_per_page: int = 40):
+    """Writes a minimal text-only PDF with the given number of pages."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1}, line {line + 1}: the mitochondria is the powerhouse of the cell."
+                 for line in range(lines_per_page)]
+        body = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({text}) '" for text in lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def _extract_concat(file_path: str) -> str:
+    """The previous implementation, kept here as the baseline."""
+    text = ""
+    with open(file_path, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        for page in reader.pages:
+            content = page.extract_text()
+            if content: text += content + "\n"
+    return text
+
+
+def _extract_parallel(file_path: str) -> list:
+    """Forces the sharded path regardless of PDF_PARALLEL_MIN_PAGES."""
+    utils.PDF_PARALLEL_MIN_PAGES = 0
+    utils.PDF_WORKERS = max(utils.PDF_WORKERS, 2)
+    return utils.extract_pdf_pages(file_path)
+
+
+def _time(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'pages':>6} {'concat (s)':>11} {'join (s)':>9} {'s/page join':>12} {'parallel (s)':>13}")
+        for pages in counts:
+            path = os.path.join(workdir, f"bench_{pages}.pdf")
+            make_pdf(path, pages)
+            concat_time, concat_text = _time(_extract_concat, path)
+            serial_pages = list(utils.iter_pdf_pages(path))
+            join_time, join_text = _time(lambda: "".join(page + "\n" for page in utils.iter_pdf_pages(path)))
+            parallel_time, parallel_pages = _time(_extract_parallel, path)
+            assert concat_text == join_text and parallel_pages == serial_pages
+            print(f"{pages:>6} {concat_time:>11.3f} {join_time:>9.3f} {join_time / pages:>12.5f} {parallel_time:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
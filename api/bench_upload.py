@@ -0,0 +1,82 @@
+"""
+Upload handling benchmark: temp file on disk vs in-memory extraction.
+
+For each document the "disk" path copies the upload to a NamedTemporaryFile,
+extracts by path and deletes the file (the previous /api/extract-text flow);
+the "memory" path copies into a SpooledTemporaryFile and extracts from it
+directly (the current flow).
+
+Usage: python bench_upload.py [repeats]
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from docx import Document
+
+from bench_pdf_extract import make_pdf
+from utils import extract_text
+
+
+def _make_docx(paragraphs: int) -> bytes:
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {i + 1}: enzymes lower the activation energy of reactions.")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _make_pdf(pages: int) -> bytes:
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench.pdf")
+        make_pdf(path, pages)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def _via_disk(data: bytes, ext: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as buffer:
+        shutil.copyfileobj(io.BytesIO(data), buffer)
+        temp_path = buffer.name
+    try:
+        return extract_text(temp_path)
+    finally:
+        os.remove(temp_path)
+
+
+def _via_memory(data: bytes, ext: str) -> str:
+    with tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024) as buffer:
+        shutil.copyfileobj(io.BytesIO(data), buffer)
+        return extract_text(buffer, ext)
+
+
+def _best_of(repeats: int, func, *args) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    documents = [
+        ("notes.txt", ".txt", ("Osmosis moves water across membranes.\n" * 2000).encode("utf-8")),
+        ("thesis.docx", ".docx", _make_docx(2000)),
+        ("slides.pdf", ".pdf", _make_pdf(20)),
+    ]
+    print(f"{'document':<12} {'bytes':>9} {'disk (ms)':>10} {'memory (ms)':>12}")
+    for name, ext, data in documents:
+        assert _via_disk(data, ext) == _via_memory(data, ext)
+        disk = _best_of(repeats, _via_disk, data, ext)
+        memory = _best_of(repeats, _via_memory, data, ext)
+        print(f"{name:<12} {len(data):>9} {disk * 1000:>10.2f} {memory * 1000:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
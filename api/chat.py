@@ -1,9 +1,10 @@
 from utils import extract_text, get_gemini_text
+from retrieval import retrieve_context
 
 def chat_with_document(file_path, user_query, chat_history=[]):
     """
-    Simulates a chat with the document. Ideally this would be RAG, 
-    but for a simple demo, we pass the extracted text as context.
+    Simulates a chat with the document. Only the passages most relevant to
+    the question (BM25 over the extracted text) are passed as context.
     """
     try:
         # Check cache or re-extract text?
@@ -16,27 +17,24 @@ def chat_with_document(file_path, user_query, chat_history=[]):
         if not text:
             return "Error: Could not read document context."
 
-        # Limit context size to avoid token limits (very crude)
-        if len(text) > 50000:
-            text = text[:50000] + "...(truncated)"
+        # Send the relevant passages instead of the whole document
+        text = retrieve_context(text, user_query)
 
         history_str = "\n".join([f"User: {msg['user']}\nAI: {msg['ai']}" for msg in chat_history])
-        
-        prompt = f"""
+
+        instruction = f"""
         You are an intelligent assistant helping a user understand a document.
-        
-        Document Content:
-        {text}
-        
+
         Chat History:
         {history_str}
-        
+
         User Question: {user_query}
-        
+
         Answer based ONLY on the document provided. If the answer is not in the document, say "I cannot find the answer in the document."
         """
 
-        return get_gemini_text(prompt)
+        # The passages are the context; the question and rules are the instruction
+        return get_gemini_text(text, instruction)
 
     except Exception as e:
         return f"Error in chat: {e}"
@@ -0,0 +1,162 @@
+"""
+Server-side chat sessions with rolling history compaction.
+
+Recent turns are kept verbatim. Once they exceed CHAT_HISTORY_TOKENS the
+oldest turns are folded into a running summary by Gemini, so the history
+part of each prompt stays roughly constant however long the chat runs.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    from .circuit_breaker import CircuitOpen
+    from .quota import QuotaExceeded
+    from .tokens import estimate_tokens
+    from .utils import get_gemini_text_async
+except ImportError:
+    from circuit_breaker import CircuitOpen
+    from quota import QuotaExceeded
+    from tokens import estimate_tokens
+    from utils import get_gemini_text_async
+
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "1500"))
+CHAT_RECENT_TURNS = int(os.environ.get("CHAT_RECENT_TURNS", "4"))
+CHAT_SESSIONS_MAX = int(os.environ.get("CHAT_SESSIONS_MAX", "1000"))
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", str(6 * 3600)))
+# A compaction running longer than this is assumed lost (e.g. its event loop went away)
+_COMPACTION_TIMEOUT = 120.0
+
+COMPACT_INSTRUCTION = (
+    "Update the running summary of this conversation about a study document with the new turns. "
+    "Keep the user's goals, questions asked, facts established and anything they may refer back to. "
+    "Reply with the updated summary only, in at most 200 words."
+)
+
+
+def _normalize_history(history: list) -> list:
+    """Accepts {"role", "content"} messages (frontend) or {"user", "ai"} pairs (chat.py)."""
+    turns = []
+    for message in history or []:
+        if "role" in message:
+            role = "user" if message.get("role") == "user" else "ai"
+            turns.append({"role": role, "content": str(message.get("content", ""))})
+        else:
+            if message.get("user"):
+                turns.append({"role": "user", "content": str(message["user"])})
+            if message.get("ai"):
+                turns.append({"role": "ai", "content": str(message["ai"])})
+    return turns
+
+
+def _render_turns(turns: list) -> str:
+    return "\n".join(f"{'User' if t['role'] == 'user' else 'AI'}: {t['content']}" for t in turns)
+
+
+class ChatSession:
+    def __init__(self, session_id: str, turns: list):
+        self.id = session_id
+        self.summary = ""
+        self.turns = turns
+        self.updated_at = time.time()
+        self.compacting_since = 0.0
+
+    def history_block(self) -> str:
+        """The conversation part of the prompt: running summary plus recent turns."""
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier conversation (summary):\n{self.summary}")
+        if self.turns:
+            parts.append(f"Recent turns:\n{_render_turns(self.turns)}")
+        return "\n\n".join(parts)
+
+    def add_turn(self, query: str, answer: str):
+        self.turns.append({"role": "user", "content": query})
+        self.turns.append({"role": "ai", "content": answer})
+        self.updated_at = time.time()
+
+    @property
+    def compacting(self) -> bool:
+        return time.time() - self.compacting_since < _COMPACTION_TIMEOUT
+
+    def over_budget(self, factor: float = 1.0) -> bool:
+        return (
+            len(self.turns) > CHAT_RECENT_TURNS
+            and estimate_tokens(_render_turns(self.turns)) > CHAT_HISTORY_TOKENS * factor
+        )
+
+    async def compact(self):
+        """Folds all but the most recent turns into the running summary."""
+        self.compacting_since = time.time()
+        try:
+            old_turns = self.turns[:-CHAT_RECENT_TURNS]
+            context = f"Current summary:\n{self.summary or '(none)'}\n\nNew turns:\n{_render_turns(old_turns)}"
+            try:
+                summary = await get_gemini_text_async(context, COMPACT_INSTRUCTION)
+            except (QuotaExceeded, CircuitOpen) as e:
+                # Compaction is best-effort; the next turn schedules it again
+                summary = f"Error: {e}"
+            if summary.startswith("Error:"):
+                print(f"Chat compaction log: {summary}")
+                return
+            self.summary = summary
+            # Turns may have been added meanwhile; drop only the ones just summarized
+            del self.turns[:len(old_turns)]
+        finally:
+            self.compacting_since = 0.0
+
+
+class ChatSessionStore:
+    def __init__(self, max_sessions=CHAT_SESSIONS_MAX, ttl=CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "compactions": 0}
+        self._tasks = set()
+
+    def get_or_create(self, session_id: str = None, history: list = None) -> ChatSession:
+        """
+        Returns the live session for session_id. Unknown or expired ids start a
+        new session seeded from the client's history (e.g. after a cold start).
+        """
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and time.time() - session.updated_at <= self.ttl:
+                self._sessions.move_to_end(session_id)
+                return session
+            session = ChatSession(session_id or uuid.uuid4().hex, _normalize_history(history))
+            self._sessions[session.id] = session
+            self.stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def schedule_compaction(self, session: ChatSession):
+        """Compacts in the background so the current answer is not delayed."""
+        if session.over_budget() and not session.compacting:
+            self.stats["compactions"] += 1
+            # Mark it now so a quick follow-up turn does not schedule a second compaction
+            session.compacting_since = time.time()
+            task = asyncio.get_running_loop().create_task(session.compact())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def ensure_budget(self, session: ChatSession):
+        """
+        Compacts inline before answering if background compaction fell behind
+        (history at twice its budget), so prompt size stays bounded.
+        """
+        if session.over_budget(2.0) and not session.compacting:
+            self.stats["compactions"] += 1
+            await session.compact()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "active": len(self._sessions)}
+
+
+chat_sessions = ChatSessionStore()
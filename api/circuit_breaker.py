@@ -0,0 +1,128 @@
+"""
+Per-model circuit breakers.
+
+Each model keeps a rolling window of recent call outcomes. When enough of
+them failed, or took longer than BREAKER_SLOW_SECONDS, the breaker opens
+and callers fail over to the next model in the priority chain instead of
+waiting on a degraded one. After BREAKER_OPEN_SECONDS the breaker
+half-opens: a single probe call is let through, and its outcome either
+closes the breaker again or re-opens it for another period.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.environ.get("BREAKER_SLOW_SECONDS", "30"))
+BREAKER_SLOW_RATE = float(os.environ.get("BREAKER_SLOW_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+# A probe running longer than this is assumed lost (e.g. its caller went away without reporting back)
+_PROBE_TIMEOUT = 120.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a model whose breaker is open."""
+
+    def __init__(self, model: str, retry_after: float = BREAKER_OPEN_SECONDS):
+        retry_after = max(1.0, retry_after)
+        super().__init__(f"Circuit open for {model}; retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)  # (succeeded, seconds)
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to this model now; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                    self.stats["rejected"] += 1
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probing and time.monotonic() - self._probe_started < _PROBE_TIMEOUT:
+                    self.stats["rejected"] += 1
+                    return False
+                self._probing = True
+                self._probe_started = time.monotonic()
+                self.stats["probes"] += 1
+            return True
+
+    def record(self, succeeded: bool, seconds: float):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if succeeded and seconds <= BREAKER_SLOW_SECONDS:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append((succeeded, seconds))
+            if self.state == CLOSED and len(self._outcomes) >= BREAKER_MIN_CALLS:
+                failures = sum(not ok for ok, _ in self._outcomes) / len(self._outcomes)
+                slow = sum(s > BREAKER_SLOW_SECONDS for _, s in self._outcomes) / len(self._outcomes)
+                if failures >= BREAKER_ERROR_RATE or slow >= BREAKER_SLOW_RATE:
+                    self._open()
+
+    def rejection(self) -> CircuitOpen:
+        """The error to raise when allow() said no."""
+        with self._lock:
+            remaining = BREAKER_OPEN_SECONDS - (time.monotonic() - self.opened_at)
+        return CircuitOpen(self.model, remaining)
+
+    def release(self):
+        """Ends a probe whose outcome says nothing about the model (e.g. it was rate limited)."""
+        with self._lock:
+            self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "state": self.state,
+                "window_calls": len(self._outcomes),
+                "window_failures": sum(not ok for ok, _ in self._outcomes),
+            }
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model)
+            return breaker
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.model: breaker.snapshot() for breaker in breakers}
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,154 @@
+"""
+Local dense-vector retrieval for chat grounding.
+
+Passages are embedded without any network service: unigrams and bigrams are
+hashed into a fixed number of buckets, TF-IDF weighted, and projected onto
+the document's top singular vectors (LSA) so related wording lands close
+together. Each document's index is a contiguous float32 matrix, optionally
+int8-quantized, saved as .npy files next to the document store (and counted
+in its budget) and loaded memory-mapped. Only the projection rows of buckets
+the document uses are kept, in float16. Queries are one batched
+matrix-vector product plus top-k.
+"""
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from .doc_store import doc_id_for, get_doc_store
+    from .retrieval import RETRIEVAL_CACHE_SIZE, RETRIEVAL_TOP_K, chunk_document, tokenize
+except ImportError:
+    from doc_store import doc_id_for, get_doc_store
+    from retrieval import RETRIEVAL_CACHE_SIZE, RETRIEVAL_TOP_K, chunk_document, tokenize
+
+DENSE_HASH_DIM = int(os.environ.get("DENSE_HASH_DIM", "4096"))
+DENSE_DIM = int(os.environ.get("DENSE_DIM", "128"))
+DENSE_QUANTIZE = os.environ.get("DENSE_QUANTIZE", "0").lower() in ("1", "true", "yes")
+
+_FILES = ("vectors", "scales", "buckets", "projection", "idf")
+
+
+def _features(text: str, buckets: dict) -> list:
+    """Hashed unigram and bigram bucket ids for a text."""
+    tokens = tokenize(text)
+    terms = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    ids = []
+    for term in terms:
+        bucket = buckets.get(term)
+        if bucket is None:
+            bucket = buckets[term] = zlib.crc32(term.encode("utf-8")) % DENSE_HASH_DIM
+        ids.append(bucket)
+    return ids
+
+
+def _term_counts(texts: list) -> np.ndarray:
+    """Sparse-in-spirit term-count matrix (len(texts) x DENSE_HASH_DIM), built row by row."""
+    counts = np.zeros((len(texts), DENSE_HASH_DIM), dtype=np.float32)
+    buckets = {}
+    for row, text in enumerate(texts):
+        ids = _features(text, buckets)
+        if ids:
+            np.add.at(counts[row], ids, 1.0)
+    return counts
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+
+class DenseIndex:
+    def __init__(self, passages: list, vectors, scales, buckets, projection, idf):
+        self.passages = passages
+        self.vectors = vectors          # (passages, dim) float32, or int8 when quantized
+        self.scales = scales            # (passages,) float32 dequantization scales, ones when float
+        self.buckets = buckets          # (used buckets,) int32 hash buckets occurring in the document
+        self.projection = projection    # (used buckets, dim) float16; rows of unused buckets are zero
+        self.idf = idf                  # (DENSE_HASH_DIM,) float32
+
+    @classmethod
+    def build(cls, passages: list, dim: int = DENSE_DIM, quantize: bool = DENSE_QUANTIZE):
+        counts = _term_counts(passages)
+        df = np.count_nonzero(counts, axis=0).astype(np.float32)
+        idf = np.log((1 + len(passages)) / (1 + df)).astype(np.float32) + 1.0
+        tfidf = np.log1p(counts) * idf
+
+        # LSA: keep the top singular directions of the TF-IDF matrix
+        rank = max(1, min(dim, len(passages)))
+        _, _, vt = np.linalg.svd(tfidf, full_matrices=False)
+        projection = np.ascontiguousarray(vt[:rank].T, dtype=np.float32)
+        vectors = _normalize(tfidf @ projection).astype(np.float32)
+        # Buckets no passage uses have all-zero rows; queries hitting them contribute nothing
+        buckets = np.flatnonzero(df).astype(np.int32)
+        projection = np.ascontiguousarray(projection[buckets], dtype=np.float16)
+
+        scales = np.ones(len(passages), dtype=np.float32)
+        if quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-8) / 127.0
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        return cls(passages, np.ascontiguousarray(vectors), scales, buckets, projection, idf)
+
+    def save(self, store, doc_id: str):
+        base_path = store.path_for(doc_id)
+        for name in _FILES:
+            tmp_path = f"{base_path}.dense-{name}.tmp.npy"
+            np.save(tmp_path, getattr(self, name))
+            store.save_artifact(tmp_path, f"{base_path}.dense-{name}.npy")
+
+    @classmethod
+    def load(cls, base_path: str, passages: list):
+        """Memory-maps a saved index; returns None when it is missing or stale."""
+        try:
+            arrays = {name: np.load(f"{base_path}.dense-{name}.npy", mmap_mode="r") for name in _FILES}
+        except (FileNotFoundError, ValueError):
+            return None
+        if arrays["vectors"].shape[0] != len(passages) or arrays["idf"].shape[0] != DENSE_HASH_DIM:
+            return None
+        return cls(passages, **arrays)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        counts = _term_counts([query])[0][self.buckets]
+        weights = np.log1p(counts) * self.idf[self.buckets]
+        return _normalize((weights @ self.projection.astype(np.float32)).astype(np.float32))
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> list:
+        """Returns up to k (cosine score, passage index) pairs, best first."""
+        if not self.passages:
+            return []
+        scores = (self.vectors @ self.embed_query(query)) * self.scales
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return sorted(((float(scores[i]), int(i)) for i in top if scores[i] > 0), reverse=True)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_dense_index(text: str, doc_id: str = None) -> DenseIndex:
+    """Returns the document's dense index from memory, disk, or a fresh build."""
+    doc_id = doc_id or doc_id_for(text)
+    with _indexes_lock:
+        index = _indexes.get(doc_id)
+        if index is not None:
+            _indexes.move_to_end(doc_id)
+            return index
+
+    passages = chunk_document(text)
+    store = get_doc_store()
+    index = DenseIndex.load(store.path_for(doc_id), passages)
+    if index is None:
+        index = DenseIndex.build(passages)
+        try:
+            index.save(store, doc_id)
+        except OSError as e:
+            print(f"Dense index log: {e}")
+
+    with _indexes_lock:
+        _indexes[doc_id] = index
+        while len(_indexes) > RETRIEVAL_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
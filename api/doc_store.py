@@ -0,0 +1,157 @@
+"""
+Server-side store for extracted document text.
+
+Documents are keyed by the sha256 of their text (the doc_id), zlib-compressed
+on disk and evicted least-recently-used once DOC_STORE_MAX_BYTES is exceeded.
+Per-document artifacts saved next to them (e.g. dense retrieval indexes)
+count towards the same budget and are evicted with their document. A small
+in-memory LRU keeps the hottest documents decompressed.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+
+DOC_STORE_DIR = os.environ.get("DOC_STORE_DIR", os.path.join(tempfile.gettempdir(), "ai_student_assistant_docs"))
+DOC_STORE_MAX_BYTES = int(os.environ.get("DOC_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+DOC_STORE_MEMORY_BYTES = int(os.environ.get("DOC_STORE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+
+_DOC_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def doc_id_for(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    def __init__(self, root=DOC_STORE_DIR, max_bytes=DOC_STORE_MAX_BYTES, memory_bytes=DOC_STORE_MEMORY_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        os.makedirs(root, exist_ok=True)
+        self._disk_size = sum(size for _, size, _ in self._documents())
+
+    def path_for(self, doc_id: str) -> str:
+        """Base path for a document; other per-document artifacts may live next to it."""
+        return os.path.join(self.root, doc_id)
+
+    def _documents(self):
+        """(doc_id, bytes of the document and its artifacts, last access) of every stored document."""
+        sizes, accessed = {}, {}
+        for name in os.listdir(self.root):
+            doc_id = name.split(".", 1)[0]
+            if not _DOC_ID.match(doc_id):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            sizes[doc_id] = sizes.get(doc_id, 0) + stat.st_size
+            if name == doc_id + ".z":
+                accessed[doc_id] = stat.st_mtime
+        # Orphaned artifacts (document already gone) sort first and are evicted first
+        return [(doc_id, size, accessed.get(doc_id, 0.0)) for doc_id, size in sizes.items()]
+
+    def _remember(self, doc_id: str, text: str):
+        if len(text) > self.memory_bytes:
+            return
+        if doc_id in self._memory:
+            self._memory_size -= len(self._memory.pop(doc_id))
+        self._memory[doc_id] = text
+        self._memory_size += len(text)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict(self):
+        """Deletes least recently used documents until the store fits its budget."""
+        if self._disk_size <= self.max_bytes:
+            return
+        for doc_id, size, _ in sorted(self._documents(), key=lambda entry: entry[2]):
+            # Per-document artifacts (e.g. retrieval indexes) go with the document
+            for name in os.listdir(self.root):
+                if name.startswith(doc_id + "."):
+                    try:
+                        os.remove(os.path.join(self.root, name))
+                    except FileNotFoundError:
+                        pass
+            self._disk_size -= size
+            if doc_id in self._memory:
+                self._memory_size -= len(self._memory.pop(doc_id))
+            if self._disk_size <= self.max_bytes:
+                break
+
+    def put(self, text: str) -> str:
+        """Stores the text (idempotent) and returns its doc_id."""
+        doc_id = doc_id_for(text)
+        path = self.path_for(doc_id) + ".z"
+        with self._lock:
+            self._remember(doc_id, text)
+            if os.path.exists(path):
+                os.utime(path)
+                return doc_id
+            compressed = zlib.compress(text.encode("utf-8"), 6)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+            self._disk_size += len(compressed)
+            self._evict()
+        return doc_id
+
+    def save_artifact(self, tmp_path: str, path: str):
+        """Moves a finished artifact file into place next to its document and charges it to the budget."""
+        with self._lock:
+            try:
+                previous = os.path.getsize(path)
+            except FileNotFoundError:
+                previous = 0
+            os.replace(tmp_path, path)
+            self._disk_size += os.path.getsize(path) - previous
+            self._evict()
+
+    def get(self, doc_id: str):
+        """Returns the stored text, or None if the doc_id is unknown or was evicted."""
+        if not _DOC_ID.match(doc_id or ""):
+            return None
+        with self._lock:
+            text = self._memory.get(doc_id)
+            path = self.path_for(doc_id) + ".z"
+            if text is not None:
+                self._memory.move_to_end(doc_id)
+                try:
+                    # Disk eviction goes by mtime, so hot documents must refresh it here too
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+                return text
+            try:
+                with open(path, "rb") as f:
+                    text = zlib.decompress(f.read()).decode("utf-8")
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+            self._remember(doc_id, text)
+            return text
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"disk_bytes": self._disk_size, "memory_entries": len(self._memory), "memory_bytes": self._memory_size}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_doc_store() -> DocumentStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DocumentStore()
+    return _store
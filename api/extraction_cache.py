@@ -0,0 +1,123 @@
+"""
+Persistent cache of extraction results keyed by the SHA-256 of the upload.
+
+A repeat upload of the same file returns its text, section offsets and
+metadata from SQLite without re-parsing the document. Texts are stored
+zlib-compressed; expired rows are purged periodically, and the oldest rows
+are evicted once the stored texts exceed EXTRACTION_CACHE_MAX_BYTES.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+EXTRACTION_CACHE_PATH = os.environ.get(
+    "EXTRACTION_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ai_student_assistant_extractions.sqlite3")
+)
+EXTRACTION_CACHE_TTL = float(os.environ.get("EXTRACTION_CACHE_TTL", str(30 * 24 * 3600)))
+# Compressed text bytes kept in the cache (/tmp is small on serverless hosts)
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Expired rows are deleted every this many writes
+_PURGE_EVERY = 20
+
+
+class ExtractionCache:
+    def __init__(self, path=EXTRACTION_CACHE_PATH, ttl=EXTRACTION_CACHE_TTL, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, page_offsets TEXT NOT NULL, "
+                "metadata TEXT NOT NULL, created_at REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(extractions)")]
+            if "size" not in columns:
+                # Tables from before the size cap: their rows count as 0 bytes until rewritten or evicted
+                self._db.execute("ALTER TABLE extractions ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            self._db.execute("DELETE FROM extractions WHERE created_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Extraction cache log: disabled ({e})")
+            self._db = None
+
+    @staticmethod
+    def key(upload_sha256: str, ext: str) -> str:
+        # The extension picks the parser, so the same bytes under another extension are a different entry
+        return f"{upload_sha256}{ext}"
+
+    def get(self, key: str):
+        """Returns {"text", "page_offsets", "metadata"} or None."""
+        with self._lock:
+            row = None
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT text, page_offsets, metadata, created_at FROM extractions WHERE key = ?", (key,)
+                ).fetchone()
+            if not row or time.time() - row[3] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            text = zlib.decompress(row[0]).decode("utf-8") if isinstance(row[0], bytes) else row[0]
+            return {"text": text, "page_offsets": json.loads(row[1]), "metadata": json.loads(row[2])}
+
+    def set(self, key: str, text: str, page_offsets: list, metadata: dict):
+        with self._lock:
+            if self._db is None:
+                return
+            compressed = zlib.compress(text.encode("utf-8"), 6)
+            if len(compressed) > self.max_bytes:
+                return
+            try:
+                previous = self._db.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extractions (key, text, page_offsets, metadata, created_at, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, compressed, json.dumps(page_offsets), json.dumps(metadata), time.time(), len(compressed)),
+                )
+                self._bytes += len(compressed) - (previous[0] if previous else 0)
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._db.execute("DELETE FROM extractions WHERE created_at < ?", (time.time() - self.ttl,))
+                    self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+                self._evict()
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Extraction cache log: {e}")
+
+    def _evict(self):
+        """Deletes the oldest entries until the cache fits in max_bytes."""
+        if self._bytes <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM extractions ORDER BY created_at").fetchall():
+            self._db.execute("DELETE FROM extractions WHERE key = ?", (key,))
+            self._bytes -= size
+            self.stats["evictions"] += 1
+            if self._bytes <= self.max_bytes:
+                break
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "bytes": self._bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_extraction_cache() -> ExtractionCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ExtractionCache()
+    return _cache
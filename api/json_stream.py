@@ -0,0 +1,48 @@
+"""
+Incremental parser for JSON arrays that arrive in chunks.
+
+Gemini streams a JSON reply as arbitrary slices of text. JsonArrayStream
+scans each slice once, tracking only string/escape state and bracket depth,
+and hands back the raw text of every top-level array element the moment its
+closing bracket arrives, so callers can validate and forward it long before
+the rest of the array exists.
+"""
+
+
+class JsonArrayStream:
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._pieces = None  # text of the element in progress, or None between elements
+        self.closed = False  # the top-level value has ended, i.e. the reply was not cut off
+
+    def feed(self, chunk: str) -> list:
+        """Consumes the next slice of the reply; returns the elements it completed."""
+        completed = []
+        start = 0 if self._pieces is not None else None
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 1 and self._pieces is None:
+                    self._pieces, start = [], i
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.closed = True
+                if self._depth == 1 and self._pieces is not None:
+                    self._pieces.append(chunk[start:i + 1])
+                    completed.append("".join(self._pieces))
+                    self._pieces, start = None, None
+        if self._pieces is not None:
+            self._pieces.append(chunk[start:])
+        return completed
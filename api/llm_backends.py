@@ -0,0 +1,434 @@
+"""
+LLM backends used by utils.get_gemini_text / get_gemini_json.
+
+LLM_BACKEND selects the implementation:
+  gemini (default) - Google Gemini through google.generativeai
+  stub             - deterministic in-process backend for load testing
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+_genai_module = None
+_genai_lock = threading.Lock()
+
+def _genai():
+    """
+    Imports and configures google.generativeai on first use. The SDK takes
+    most of a second to import, so cold starts that never call Gemini
+    (health checks, cached answers, uploads) skip it entirely.
+    """
+    global _genai_module
+    if _genai_module is None:
+        with _genai_lock:
+            if _genai_module is None:
+                if not os.environ.get("GOOGLE_API_KEY"):
+                    # Scripts run outside app.py keep the key in .env
+                    from dotenv import load_dotenv
+                    load_dotenv()
+                import google.generativeai as genai
+                api_key = os.environ.get("GOOGLE_API_KEY")
+                if api_key:
+                    genai.configure(api_key=api_key)
+                _genai_module = genai
+    return _genai_module
+
+# Priority order to stay within stable quotas
+MODEL_PRIORITIES = [
+    "models/gemini-1.5-flash",
+    "models/gemini-1.5-flash-latest",
+    "models/gemini-pro"
+]
+FALLBACK_MODEL = "gemini-1.5-flash"
+
+# Model discovery cache: resolved once per process, snapshotted to disk for cold starts
+MODEL_CACHE_TTL = float(os.environ.get("MODEL_CACHE_TTL", "3600"))
+MODEL_CACHE_RETRY = float(os.environ.get("MODEL_CACHE_RETRY", "60"))
+MODEL_CACHE_FILE = os.environ.get(
+    "MODEL_CACHE_FILE", os.path.join(tempfile.gettempdir(), "ai_student_assistant_model.json")
+)
+
+_model_lock = threading.Lock()
+_model_cache = {"name": None, "model": None, "resolved_at": 0.0, "fallbacks": None}
+_named_models = {}
+_refresh_thread = None
+
+def _resolve_model_names() -> list:
+    """Asks the API which models this key can use; returns the usable ones, best first."""
+    available_models = [m.name for m in _genai().list_models() if 'generateContent' in m.supported_generation_methods]
+    names = [model_path for model_path in MODEL_PRIORITIES if model_path in available_models]
+    # Fallback to whatever is available
+    return names or available_models[:1]
+
+def _load_model_snapshot():
+    """Reads the last resolved model name (and its fallbacks) from disk, if any."""
+    try:
+        with open(MODEL_CACHE_FILE, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        return snapshot["name"], float(snapshot["resolved_at"]), snapshot.get("fallbacks")
+    except Exception:
+        return None, 0.0, None
+
+def _save_model_snapshot(name: str, resolved_at: float, fallbacks: list):
+    try:
+        tmp_path = MODEL_CACHE_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name": name, "resolved_at": resolved_at, "fallbacks": fallbacks}, f)
+        os.replace(tmp_path, MODEL_CACHE_FILE)
+    except OSError as e:
+        print(f"Model snapshot log: {e}")
+
+def _store_model(name: str, resolved_at: float, fallbacks: list = None):
+    with _model_lock:
+        if _model_cache["name"] != name or _model_cache["model"] is None:
+            _model_cache["model"] = _genai().GenerativeModel(name)
+        _model_cache["name"] = name
+        _model_cache["resolved_at"] = resolved_at
+        if fallbacks is not None:
+            _model_cache["fallbacks"] = fallbacks
+        return _model_cache["model"]
+
+def _refresh_model():
+    """Resolves the model over the network and updates memory + disk caches."""
+    try:
+        name, *fallbacks = _resolve_model_names()
+        resolved_at = time.time()
+        _save_model_snapshot(name, resolved_at, fallbacks)
+        return _store_model(name, resolved_at, fallbacks)
+    except Exception as e:
+        print(f"Model selection log: {e}")
+        # Final hard-coded fallback, retried again after MODEL_CACHE_RETRY seconds
+        with _model_lock:
+            name = _model_cache["name"] or FALLBACK_MODEL
+        return _store_model(name, time.time() - MODEL_CACHE_TTL + MODEL_CACHE_RETRY)
+
+def _refresh_model_in_background():
+    global _refresh_thread
+    with _model_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=_refresh_model, name="model-refresh", daemon=True)
+        _refresh_thread.start()
+
+def get_model(force_refresh: bool = False):
+    """
+    Finds the best available model. 
+    Prioritizes 1.5-flash for speed and higher free-tier quotas.
+
+    The choice is cached in-process for MODEL_CACHE_TTL seconds and
+    snapshotted to disk so cold starts skip the list_models round-trip.
+    Stale entries are served while a background thread refreshes them.
+    """
+    if force_refresh:
+        return _refresh_model()
+
+    with _model_lock:
+        model = _model_cache["model"]
+        resolved_at = _model_cache["resolved_at"]
+
+    if model is None:
+        name, resolved_at, fallbacks = _load_model_snapshot()
+        if name is None:
+            return _refresh_model()
+        model = _store_model(name, resolved_at, fallbacks)
+
+    if time.time() - resolved_at > MODEL_CACHE_TTL:
+        _refresh_model_in_background()
+    return model
+
+def model_chain() -> list:
+    """
+    Names of the models to try, best first: the selected model, then the
+    other usable priority models (all of MODEL_PRIORITIES if discovery failed).
+    """
+    primary = get_model().model_name
+    with _model_lock:
+        fallbacks = _model_cache["fallbacks"]
+    if fallbacks is None:
+        fallbacks = MODEL_PRIORITIES
+    return [primary] + [name for name in fallbacks if name != primary]
+
+def get_model_named(name: str):
+    """A GenerativeModel for a specific model name, created once per process."""
+    with _model_lock:
+        model = _named_models.get(name)
+    if model is None:
+        model = _genai().GenerativeModel(name)
+        with _model_lock:
+            model = _named_models.setdefault(name, model)
+    return model
+
+def is_model_not_found(error: Exception) -> bool:
+    """True when Gemini rejected the call because the model no longer exists."""
+    message = str(error).lower()
+    return type(error).__name__ == "NotFound" or ("not found" in message and "model" in message)
+
+
+class LLMBackend:
+    """Interface every generation backend implements."""
+    name = "base"
+
+    @property
+    def model_name(self) -> str:
+        return self.name
+
+    def model_names(self) -> list:
+        """Models to fail over through, best first; model_name comes first."""
+        return [self.model_name]
+
+    def generate(self, prompt: str, response_schema: dict = None, model: str = None,
+                 max_output_tokens: int = None, timeout: float = None) -> str:
+        """
+        Returns the full completion text for a prompt from model (default:
+        model_name). With a response_schema the reply is constrained to JSON
+        of that shape where the backend can; max_output_tokens caps its length.
+        A call still running after timeout seconds fails (e.g. TimeoutError).
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt: str, response_schema: dict = None, model: str = None,
+               max_output_tokens: int = None, timeout: float = None):
+        """Yields the completion in chunks; closing the generator abandons the upstream call."""
+        yield self.generate(prompt, response_schema, model, max_output_tokens, timeout)
+
+    def count_tokens(self, text: str) -> int:
+        """Exact token count of text for model_name, as the provider bills it."""
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    @property
+    def model_name(self) -> str:
+        return get_model().model_name
+
+    def model_names(self) -> list:
+        return model_chain()
+
+    def generate(self, prompt: str, response_schema: dict = None, model: str = None,
+                 max_output_tokens: int = None, timeout: float = None) -> str:
+        """Runs generate_content, re-resolving the selected model once if it has disappeared."""
+        if model is not None and model != self.model_name:
+            return self._generate(get_model_named(model), prompt, response_schema, max_output_tokens, timeout).text
+        try:
+            return self._generate(get_model(), prompt, response_schema, max_output_tokens, timeout).text
+        except Exception as e:
+            if not is_model_not_found(e):
+                raise
+            print(f"Model selection log: {e}; refreshing model list")
+            return self._generate(get_model(force_refresh=True), prompt, response_schema, max_output_tokens,
+                                  timeout).text
+
+    @staticmethod
+    def _generate(model, prompt: str, response_schema: dict = None, max_output_tokens: int = None,
+                  timeout: float = None, stream: bool = False):
+        base_config = {"max_output_tokens": max_output_tokens} if max_output_tokens else {}
+        # Gemini raises DeadlineExceeded once the timeout passes
+        options = {"request_options": {"timeout": timeout}} if timeout is not None else {}
+        if response_schema is None:
+            return model.generate_content(prompt, generation_config=base_config or None, stream=stream, **options)
+        generation_config = {**base_config, "response_mime_type": "application/json", "response_schema": response_schema}
+        try:
+            return model.generate_content(prompt, generation_config=generation_config, stream=stream, **options)
+        except Exception as e:
+            # Older models (e.g. gemini-pro) reject structured output; fall back to the plain prompt
+            if type(e).__name__ != "InvalidArgument":
+                raise
+            print(f"Structured output log: {e}; retrying without a response schema")
+            return model.generate_content(prompt, generation_config=base_config or None, stream=stream, **options)
+
+    def stream(self, prompt: str, response_schema: dict = None, model: str = None,
+               max_output_tokens: int = None, timeout: float = None):
+        selected = get_model()
+        if model is not None and model != selected.model_name:
+            selected = get_model_named(model)
+        response = self._generate(selected, prompt, response_schema, max_output_tokens, timeout, stream=True)
+        try:
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            # Cancel the underlying stream when the consumer stops early
+            cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+            if cancel is not None:
+                cancel()
+
+    def count_tokens(self, text: str) -> int:
+        return get_model().count_tokens(text).total_tokens
+
+
+class StubBackendError(Exception):
+    """Injected upstream failure; carries an HTTP-like status code."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+STUB_MCQS = [
+    {"question": f"Stub question {i + 1}?", "options": ["Option A", "Option B", "Option C"], "answer": i % 3}
+    for i in range(10)
+]
+STUB_FLASHCARDS = [{"front": f"Stub term {i + 1}", "back": f"Stub definition {i + 1}"} for i in range(10)]
+_STUB_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def parse_latency(spec: str):
+    """
+    Parses a latency distribution spec into a sampler returning seconds.
+
+    Formats: "0.5" or "fixed:0.5", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+    "lognormal:MEDIAN,SIGMA".
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    values = [float(v) for v in args.split(",")]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubBackend(LLMBackend):
+    """
+    In-process backend with configurable latency, token rate and failures.
+
+    Output is derived from the prompt, so the same prompt always produces the
+    same completion. Randomness (latency jitter, error injection) comes from a
+    seeded generator so whole load-test runs are reproducible.
+    """
+    name = "stub"
+
+    def __init__(self, latency="0.5", tokens_per_second=0.0, error_rate=0.0, error_code=503,
+                 seed=0, responses=None):
+        self.sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.responses = responses or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        responses = None
+        responses_file = os.environ.get("STUB_RESPONSES_FILE")
+        if responses_file:
+            with open(responses_file, "r", encoding="utf-8") as f:
+                responses = json.load(f)
+        return cls(
+            latency=os.environ.get("STUB_LATENCY", "0.5"),
+            tokens_per_second=float(os.environ.get("STUB_TOKENS_PER_SEC", "0")),
+            error_rate=float(os.environ.get("STUB_ERROR_RATE", "0")),
+            error_code=int(os.environ.get("STUB_ERROR_CODE", "503")),
+            seed=int(os.environ.get("STUB_SEED", "0")),
+            responses=responses,
+        )
+
+    @property
+    def model_name(self) -> str:
+        return "stub/model"
+
+    def _completion(self, prompt: str) -> str:
+        # Canned responses: the first keyword found in the prompt wins
+        for keyword, response in self.responses.items():
+            if keyword in prompt:
+                return response if isinstance(response, str) else json.dumps(response)
+        lowered = prompt.lower()
+        if "valid json" in lowered:
+            if "study pack" in lowered:
+                return json.dumps({"summary": "**Stub summary**", "mcqs": STUB_MCQS, "flashcards": STUB_FLASHCARDS})
+            if "flashcard" in lowered:
+                return json.dumps(STUB_FLASHCARDS)
+            return json.dumps(STUB_MCQS)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"**Stub response {digest}**\n- The prompt had {len(prompt)} characters."
+
+    def _sample(self):
+        with self._lock:
+            return self.sample_latency(self._rng), self._rng.random() < self.error_rate
+
+    def _capped(self, prompt: str, max_output_tokens: int = None) -> str:
+        text = self._completion(prompt)
+        if max_output_tokens:
+            # Mimics a reply cut off at the output limit, the way Gemini truncates
+            text = text[:max_output_tokens * 4]
+        return text
+
+    def count_tokens(self, text: str) -> int:
+        # A subword-like split (words in pieces of up to 4 characters, punctuation alone)
+        return len(_STUB_TOKEN.findall(text))
+
+    @staticmethod
+    def _wait(delay: float, deadline: float = None):
+        """Sleeps for delay, or until deadline and then raises TimeoutError, like a client-side timeout."""
+        if deadline is not None and time.monotonic() + delay > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            raise TimeoutError("Stub call timed out")
+        time.sleep(delay)
+
+    def generate(self, prompt: str, response_schema: dict = None, model: str = None,
+                 max_output_tokens: int = None, timeout: float = None) -> str:
+        # Canned JSON replies already have the requested shape, so the schema is not enforced
+        text = self._capped(prompt, max_output_tokens)
+        delay, failed = self._sample()
+        if self.tokens_per_second > 0:
+            delay += (len(text) / 4) / self.tokens_per_second
+        self._wait(delay, time.monotonic() + timeout if timeout is not None else None)
+        if failed:
+            raise StubBackendError(self.error_code, "Injected stub failure")
+        return text
+
+    def stream(self, prompt: str, response_schema: dict = None, model: str = None,
+               max_output_tokens: int = None, timeout: float = None):
+        text = self._capped(prompt, max_output_tokens)
+        delay, failed = self._sample()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        # The sampled latency is time-to-first-chunk; the token rate paces the rest
+        self._wait(delay, deadline)
+        if failed:
+            raise StubBackendError(self.error_code, "Injected stub failure")
+        chunk_chars = 64
+        for start in range(0, len(text), chunk_chars):
+            chunk = text[start:start + chunk_chars]
+            if start and self.tokens_per_second > 0:
+                self._wait((len(chunk) / 4) / self.tokens_per_second, deadline)
+            yield chunk
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> LLMBackend:
+    """Returns the process-wide backend selected by LLM_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = os.environ.get("LLM_BACKEND", "gemini").lower()
+                if kind == "stub":
+                    _backend = StubBackend.from_env()
+                elif kind == "gemini":
+                    _backend = GeminiBackend()
+                else:
+                    raise ValueError(f"Unknown LLM_BACKEND: {kind}")
+    return _backend
+
+def set_backend(backend: LLMBackend):
+    """Swaps the process-wide backend (benchmarks, load tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
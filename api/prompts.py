@@ -0,0 +1,18 @@
+"""Instructions sent to Gemini by the API endpoints."""
+
+SUMMARIZE_INSTRUCTION = "Summarize the following text professionally. Use clear headings, bullet points, and bold key terms."
+
+MCQ_INSTRUCTION = "Generate 10 multiple choice questions. Return ONLY a JSON list: [{\"question\": \"...\", \"options\": [\"...\", \"...\", \"...\"], \"answer\": 0}]"
+
+FLASHCARDS_INSTRUCTION = "Generate 10 flashcards. Return ONLY a JSON list: [{\"front\": \"...\", \"back\": \"...\"}]"
+
+STUDY_PACK_INSTRUCTION = (
+    "Create a study pack for the text. Return ONLY a JSON object with three keys: "
+    "\"summary\": a professional summary as a Markdown string with clear headings, bullet points and bold key terms; "
+    "\"mcqs\": 10 multiple choice questions as [{\"question\": \"...\", \"options\": [\"...\", \"...\", \"...\"], \"answer\": 0}]; "
+    "\"flashcards\": 10 flashcards as [{\"front\": \"...\", \"back\": \"...\"}]"
+)
+
+def chat_instruction(query: str, history: str = "") -> str:
+    conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+    return f"{conversation}User Question: {query}\nAnswer based contextually on the provided text."
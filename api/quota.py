@@ -0,0 +1,224 @@
+"""
+Quota governor in front of the model layer.
+
+Every upstream generation first reserves one request and its estimated
+tokens from per-model token buckets (requests/minute and tokens/minute).
+When a bucket is empty the caller waits for its turn; once QUOTA_QUEUE_SIZE
+callers are already waiting, or the wait would exceed QUOTA_MAX_WAIT, the
+call is rejected with QuotaExceeded, which the API turns into 429 +
+Retry-After. Quota errors from Gemini itself pause the model's buckets for
+the delay Gemini asks for.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from .tokens import estimate_tokens
+except ImportError:
+    from tokens import estimate_tokens
+
+# Unlimited (0) unless set; match your API tier, e.g. 15 / 1000000 on the Gemini free tier
+QUOTA_RPM = float(os.environ.get("QUOTA_RPM", "0"))
+QUOTA_TPM = float(os.environ.get("QUOTA_TPM", "0"))
+# Per-model overrides, e.g. {"models/gemini-1.5-flash": {"rpm": 2000, "tpm": 4000000}}; 0 means unlimited
+QUOTA_LIMITS = json.loads(os.environ.get("QUOTA_LIMITS", "{}"))
+QUOTA_QUEUE_SIZE = int(os.environ.get("QUOTA_QUEUE_SIZE", "32"))
+QUOTA_MAX_WAIT = float(os.environ.get("QUOTA_MAX_WAIT", "20"))
+# Pause after an upstream quota error that does not say how long to wait
+QUOTA_UPSTREAM_BACKOFF = float(os.environ.get("QUOTA_UPSTREAM_BACKOFF", "30"))
+
+_RETRY_DELAY = re.compile(r"retry(?:_delay)?\D{0,20}?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class QuotaExceeded(Exception):
+    """Raised when a generation cannot be admitted; retry_after is in seconds."""
+
+    def __init__(self, model: str, retry_after: float, reason: str):
+        retry_after = max(1.0, retry_after)
+        super().__init__(f"Rate limit reached for {model} ({reason}); retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_quota_error(error: Exception) -> bool:
+    """True for upstream rate-limit / quota failures (HTTP 429, RESOURCE_EXHAUSTED)."""
+    if isinstance(error, QuotaExceeded):
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message and ("quota" in message or "rate" in message)
+
+
+def upstream_retry_after(error: Exception) -> float:
+    """The delay an upstream quota error asks for, or QUOTA_UPSTREAM_BACKOFF."""
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else QUOTA_UPSTREAM_BACKOFF
+
+
+def request_tokens(prompt: str, output_tokens: int) -> int:
+    """Tokens to reserve for a call: the estimated prompt plus the reply limit, since tokens/minute counts both."""
+    return estimate_tokens(prompt) + output_tokens
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, holding at most per_minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (amounts above capacity count as a full bucket)."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        """Debits amount; the level may go negative, which queues later callers behind it."""
+        if self.rate > 0:
+            self.level -= min(amount, self.capacity)
+
+    def drain(self):
+        if self.rate > 0:
+            self.level = min(self.level, 0.0)
+
+
+class ModelQuota:
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.stats = {"admitted": 0, "delayed": 0, "rejected": 0, "upstream_429": 0}
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int, wait: bool = True):
+        """
+        Reserves one request and tokens; returns how long the caller must wait
+        first. With wait=False nothing is reserved (and None is returned) unless
+        the call can go out immediately.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(
+                self.requests.delay_for(1, now),
+                self.tokens.delay_for(tokens, now),
+                self.paused_until - now,
+                0.0,
+            )
+            if delay > 0:
+                if not wait:
+                    return None
+                if self.waiting >= QUOTA_QUEUE_SIZE:
+                    self.stats["rejected"] += 1
+                    raise QuotaExceeded(self.model, delay, "wait queue full")
+                if delay > QUOTA_MAX_WAIT:
+                    self.stats["rejected"] += 1
+                    raise QuotaExceeded(self.model, delay, "wait too long")
+                self.waiting += 1
+                self.stats["delayed"] += 1
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.stats["admitted"] += 1
+            return delay
+
+    def done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def pause(self, seconds: float):
+        """Stops admitting calls for a while after Gemini itself reported a quota error."""
+        with self._lock:
+            self.stats["upstream_429"] += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.requests.drain()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                **self.stats,
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "waiting": self.waiting,
+                "next_slot_in": round(max(self.requests.delay_for(1, now), self.paused_until - now, 0.0), 2),
+            }
+
+
+def _limits_for(model: str) -> dict:
+    limits = QUOTA_LIMITS.get(model) or QUOTA_LIMITS.get(model.replace("models/", "", 1))
+    if limits is not None:
+        return limits
+    if model.startswith("stub/"):
+        # The load-testing backend is only throttled when QUOTA_LIMITS names it
+        return {"rpm": 0, "tpm": 0}
+    return {"rpm": QUOTA_RPM, "tpm": QUOTA_TPM}
+
+
+class QuotaGovernor:
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def quota_for(self, model: str) -> ModelQuota:
+        with self._lock:
+            quota = self._models.get(model)
+            if quota is None:
+                limits = _limits_for(model)
+                quota = self._models[model] = ModelQuota(model, float(limits.get("rpm", 0)), float(limits.get("tpm", 0)))
+                rpm, tpm = (f"{limit:g}" if limit else "unlimited" for limit in (quota.requests.capacity, quota.tokens.capacity))
+                print(f"Quota log: {model} admits {rpm} requests/min, {tpm} tokens/min")
+            return quota
+
+    def acquire(self, model: str, tokens: int):
+        """Blocks until the call is admitted; raises QuotaExceeded when it cannot be."""
+        quota = self.quota_for(model)
+        delay = quota.reserve(tokens)
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            finally:
+                quota.done_waiting()
+
+    def try_acquire(self, model: str, tokens: int) -> bool:
+        """Admits the call only if it needs no wait (used for optional extra calls such as hedges)."""
+        return self.quota_for(model).reserve(tokens, wait=False) is not None
+
+    async def acquire_async(self, model: str, tokens: int):
+        quota = self.quota_for(model)
+        delay = quota.reserve(tokens)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                quota.done_waiting()
+
+    def upstream_error(self, model: str, error: Exception) -> QuotaExceeded:
+        """Records a quota error from Gemini and returns the QuotaExceeded to raise."""
+        retry_after = upstream_retry_after(error)
+        self.quota_for(model).pause(retry_after)
+        return QuotaExceeded(model, retry_after, "upstream quota")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            quotas = list(self._models.values())
+        return {quota.model: quota.snapshot() for quota in quotas}
+
+
+quota_governor = QuotaGovernor()
@@ -0,0 +1,191 @@
+"""
+Retries and hedged requests for upstream generations.
+
+Transient failures (5xx, timeouts, dropped connections) are retried with
+full-jitter exponential backoff: each wait is uniform in [0, min(cap,
+base * 2^attempt)], so a burst of failed calls does not retry in lockstep.
+All attempts share one GENERATION_DEADLINE, and each attempt is told how
+much of it is left, so a hung call times out instead of holding its thread
+past the deadline. Client errors and quota errors
+are never retried here; the quota governor owns those.
+
+With HEDGE_ENABLED, a call still running after the model's recent p95
+latency gets a duplicate request; whichever answers first wins and the
+other result is discarded. Hedges are only sent when the quota governor
+can admit them without waiting, so they never queue behind real traffic.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from .quota import QuotaExceeded
+except ImportError:
+    from quota import QuotaExceeded
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "8"))
+# Total seconds one generation may spend across all attempts and backoff
+GENERATION_DEADLINE = float(os.environ.get("GENERATION_DEADLINE", "60"))
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))
+# Hedging waits for this many latency samples, and never fires earlier than HEDGE_MIN_DELAY
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", "16"))
+
+_RETRYABLE_ERRORS = frozenset((
+    "ServiceUnavailable", "InternalServerError", "BadGateway", "GatewayTimeout",
+    "DeadlineExceeded", "Aborted", "RetryError",
+))
+_RETRYABLE_CODES = frozenset((500, 502, 503, 504))
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for failures worth another attempt: 5xx, timeouts, dropped connections."""
+    if isinstance(error, QuotaExceeded):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ in _RETRYABLE_ERRORS:
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in _RETRYABLE_CODES
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter backoff before retry number attempt (1-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one model."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """The q-quantile of recent latencies, or None without enough samples."""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Resilience:
+    def __init__(self):
+        self._latency = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.stats = {"retries": 0, "gave_up": 0, "hedges": 0, "hedge_wins": 0}
+
+    def latency(self, model: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latency.get(model)
+            if tracker is None:
+                tracker = self._latency[model] = LatencyTracker()
+            return tracker
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+            return self._pool
+
+    def _timed(self, model: str, request, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Generation deadline of {GENERATION_DEADLINE:.0f}s passed")
+        started = time.monotonic()
+        result = request(remaining)
+        self.latency(model).record(time.monotonic() - started)
+        return result
+
+    def _admitted(self, model: str, request, admit, deadline: float):
+        if admit is not None:
+            admit()
+        return self._timed(model, request, deadline)
+
+    def _hedge(self, model: str, request, admit_hedge, deadline: float):
+        if not admit_hedge():
+            raise QuotaExceeded(model, 0, "no spare quota for a hedge")
+        return self._timed(model, request, deadline)
+
+    def _hedged(self, model: str, request, admit, admit_hedge, deadline: float):
+        """Runs request; if it outlives the model's p95 latency, races it against a duplicate."""
+        delay = self.latency(model).quantile(HEDGE_QUANTILE) if HEDGE_ENABLED and admit_hedge else None
+        if delay is None:
+            return self._admitted(model, request, admit, deadline)
+
+        pool = self._get_pool()
+        if admit is not None:
+            # Wait for quota here so queueing time does not count towards the hedge delay
+            admit()
+        first = pool.submit(self._timed, model, request, deadline)
+        done, _ = wait([first], timeout=max(delay, HEDGE_MIN_DELAY))
+        if done:
+            return first.result()
+        second = pool.submit(self._hedge, model, request, admit_hedge, deadline)
+        self.count("hedges")
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self.count("hedge_wins")
+                    return future.result()
+        # Both failed; the primary's error is the meaningful one
+        return first.result()
+
+    def call(self, model: str, request, admit=None, admit_hedge=None):
+        """
+        Runs request(timeout) with retries on transient errors under
+        GENERATION_DEADLINE; timeout is the seconds left of it, and once none
+        are left the call fails with TimeoutError. admit() is called before
+        every attempt (e.g. to wait for quota); admit_hedge() returns whether
+        a hedge may be sent right now.
+        """
+        deadline = time.monotonic() + GENERATION_DEADLINE
+        attempt = 1
+        while True:
+            try:
+                return self._hedged(model, request, admit, admit_hedge, deadline)
+            except Exception as e:
+                delay = backoff_delay(attempt)
+                if (not is_retryable(e) or attempt >= RETRY_MAX_ATTEMPTS
+                        or time.monotonic() + delay > deadline):
+                    if is_retryable(e):
+                        self.count("gave_up")
+                    raise
+                print(f"Retry log: {type(e).__name__} from {model}; attempt {attempt + 1} in {delay:.2f}s")
+                self.count("retries")
+                time.sleep(delay)
+                attempt += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            trackers = dict(self._latency)
+            stats = dict(self.stats)
+        stats["p95_seconds"] = {
+            model: round(p95, 3) for model, p95 in
+            ((model, tracker.quantile(0.95)) for model, tracker in trackers.items()) if p95 is not None
+        }
+        return stats
+
+
+resilience = Resilience()
@@ -0,0 +1,125 @@
+"""
+Content-addressed cache for Gemini responses.
+
+Entries are keyed by sha256(model, instruction, context). A byte-bounded LRU
+sits in front of a SQLite table that survives restarts; disk entries expire
+after RESPONSE_CACHE_TTL seconds.
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_MEMORY_BYTES = int(os.environ.get("RESPONSE_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ai_student_assistant_cache.sqlite3")
+)
+
+# Expired disk rows are purged once every this many writes
+_PURGE_EVERY = 200
+
+
+def cache_key(model: str, instruction: str, context: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, instruction, context):
+        encoded = part.encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") never collide
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=RESPONSE_CACHE_PATH, memory_bytes=RESPONSE_CACHE_MEMORY_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.memory_bytes = memory_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._db = None
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Response cache log: disk tier disabled ({e})")
+            self._db = None
+
+    def _remember(self, key: str, value: str):
+        """Inserts into the memory tier, evicting least recently used entries."""
+        size = len(value)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = value
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return value
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and time.time() - row[1] <= self.ttl:
+                    self._remember(key, row[0])
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._remember(key, value)
+            self.stats["writes"] += 1
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self._writes += 1
+                if self._writes % _PURGE_EVERY == 0:
+                    self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Response cache log: {e}")
+
+    def snapshot(self) -> dict:
+        """Counters and sizes for the metrics endpoint."""
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = lookups - self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
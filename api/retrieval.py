@@ -0,0 +1,171 @@
+"""
+Passage retrieval for chat grounding.
+
+Documents are split into overlapping passages and indexed with an inverted
+index scored by BM25. Indexes are built once per document (at upload time or
+on first use) and kept in an LRU keyed by the document hash, so each chat
+turn only sends the top-k relevant passages to Gemini.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+try:
+    from .doc_store import doc_id_for
+    from .tokens import estimate_tokens, token_budget
+except ImportError:
+    from doc_store import doc_id_for
+    from tokens import estimate_tokens, token_budget
+
+PASSAGE_CHARS = int(os.environ.get("PASSAGE_CHARS", "1500"))
+PASSAGE_OVERLAP = int(os.environ.get("PASSAGE_OVERLAP", "200"))
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "6"))
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "32"))
+# bm25 (lexical), dense (local LSA embeddings, needs numpy) or hybrid (both, rank-fused)
+CHAT_RETRIEVER = os.environ.get("CHAT_RETRIEVER", "bm25").lower()
+# Documents up to this size are sent whole; retrieval only pays off beyond it
+CHAT_FULL_CONTEXT_CHARS = int(os.environ.get("CHAT_FULL_CONTEXT_CHARS", "12000"))
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what "
+    "when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def chunk_document(text: str, size: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP) -> list:
+    """Splits text into overlapping passages, preferring paragraph or sentence breaks."""
+    passages = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            window = text[start:end]
+            cut = max(window.rfind("\n\n"), window.rfind(". "), window.rfind("\n"))
+            if cut > size // 2:
+                end = start + cut + 1
+        passage = text[start:end].strip()
+        if passage:
+            passages.append(passage)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return passages
+
+
+class BM25Index:
+    def __init__(self, passages: list, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> [(passage index, term frequency)]
+        self.lengths = []
+        for index, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((index, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(passages)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> list:
+        """Returns up to k (score, passage index) pairs, best first."""
+        scores = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+                scores[index] = scores.get(index, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(((score, index) for index, score in scores.items()), reverse=True)[:k]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_bm25_index(text: str, doc_id: str = None) -> BM25Index:
+    """Returns the cached index for a document, building it on first use."""
+    doc_id = doc_id or doc_id_for(text)
+    with _indexes_lock:
+        index = _indexes.get(doc_id)
+        if index is not None:
+            _indexes.move_to_end(doc_id)
+            return index
+    index = BM25Index(chunk_document(text))
+    with _indexes_lock:
+        _indexes[doc_id] = index
+        while len(_indexes) > RETRIEVAL_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _fuse(rankings: list, k: int) -> list:
+    """Reciprocal rank fusion of several best-first (score, index) lists."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (_, index) in enumerate(ranking):
+            fused[index] = fused.get(index, 0.0) + 1.0 / (60 + rank)
+    return sorted(((score, index) for index, score in fused.items()), reverse=True)[:k]
+
+
+def build_indexes(text: str, doc_id: str = None):
+    """Builds (or loads) every index the configured retriever needs."""
+    if CHAT_RETRIEVER != "dense":
+        get_bm25_index(text, doc_id)
+    if CHAT_RETRIEVER != "bm25":
+        # Imported lazily so the default BM25 path does not need numpy
+        try:
+            from .dense_index import get_dense_index
+        except ImportError:
+            from dense_index import get_dense_index
+        get_dense_index(text, doc_id)
+
+
+def search_passages(text: str, query: str, k: int = RETRIEVAL_TOP_K, doc_id: str = None):
+    """Returns (passages, best-first hits) from the configured retriever."""
+    if CHAT_RETRIEVER == "bm25":
+        index = get_bm25_index(text, doc_id)
+        return index.passages, index.search(query, k)
+
+    try:
+        from .dense_index import get_dense_index
+    except ImportError:
+        from dense_index import get_dense_index
+    dense = get_dense_index(text, doc_id)
+    if CHAT_RETRIEVER == "dense":
+        return dense.passages, dense.search(query, k)
+    lexical = get_bm25_index(text, doc_id)
+    return dense.passages, _fuse([lexical.search(query, k * 2), dense.search(query, k * 2)], k)
+
+
+def retrieve_context(text: str, query: str, k: int = RETRIEVAL_TOP_K, doc_id: str = None,
+                     max_tokens: int = None) -> str:
+    """
+    Builds the chat context for a query: the whole text for short documents,
+    otherwise the best of the k top passages that fit in max_tokens (default:
+    the current endpoint's input budget), in document order.
+    """
+    max_tokens = max_tokens or token_budget().input
+    if len(text) <= CHAT_FULL_CONTEXT_CHARS and estimate_tokens(text) <= max_tokens:
+        return text
+    passages, hits = search_passages(text, query, k, doc_id)
+    chosen, used = [], 0
+    for i in [i for _, i in hits] or list(range(min(k, len(passages)))):
+        tokens = estimate_tokens(passages[i])
+        # The best passage is always sent; lower-ranked ones only while they fit
+        if chosen and used + tokens > max_tokens:
+            continue
+        chosen.append(i)
+        used += tokens
+    return "\n\n[...]\n\n".join(passages[i] for i in sorted(chosen))
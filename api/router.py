@@ -0,0 +1,139 @@
+"""
+Adaptive model routing.
+
+Every upstream call is timed per model against its prompt size, and a
+rolling least-squares fit (latency = overhead + seconds per token * tokens)
+predicts how long each model would take for the next prompt. The router
+puts first the cheapest model predicted to meet the endpoint's latency
+target (ROUTER_TARGETS). If none would, the fastest goes first. The rest of
+the priority chain stays behind it for failover. Chat has a tight target, so
+its turns drift to the fastest model while bulk MCQ generation stays on
+the cheapest.
+
+The endpoint is carried in a context variable set per request by app.py,
+so nothing between the handler and the model call needs to pass it along.
+"""
+import contextvars
+import json
+import os
+import threading
+from collections import deque
+
+# Seconds each endpoint may take; "default" covers anything not listed
+ROUTER_TARGETS = {
+    "chat": 6.0, "summarize": 30.0, "mcq": 30.0, "flashcards": 30.0, "study_pack": 45.0, "default": 30.0,
+    **json.loads(os.environ.get("ROUTER_TARGETS", "{}")),
+}
+# Relative price per call; unlisted models cost 1
+ROUTER_MODEL_COSTS = {
+    "models/gemini-1.5-flash": 1.0, "models/gemini-1.5-flash-latest": 1.0, "models/gemini-pro": 4.0,
+    **json.loads(os.environ.get("ROUTER_MODEL_COSTS", "{}")),
+}
+ROUTER_MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", "5"))
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", "100"))
+# Assumed before a model has ROUTER_MIN_SAMPLES observations
+_PRIOR_OVERHEAD = 1.5
+_PRIOR_SECONDS_PER_TOKEN = 1 / 10000
+
+current_endpoint = contextvars.ContextVar("current_endpoint", default="default")
+
+
+def endpoint_for_path(path: str) -> str:
+    """"/api/study-pack/stream" -> "study_pack"."""
+    parts = [part for part in path.split("/") if part and part != "api"]
+    return parts[0].replace("-", "_") if parts else "default"
+
+
+class LatencyModel:
+    """Rolling (prompt tokens, seconds) samples of one model with a linear fit."""
+
+    def __init__(self):
+        self._samples = deque(maxlen=ROUTER_WINDOW)
+        self._fit = None
+        self._lock = threading.Lock()
+
+    def observe(self, tokens: int, seconds: float):
+        with self._lock:
+            self._samples.append((tokens, seconds))
+            self._fit = None
+
+    def _coefficients(self):
+        """(overhead seconds, seconds per token), refit lazily after new samples."""
+        if self._fit is None:
+            n = len(self._samples)
+            if n < ROUTER_MIN_SAMPLES:
+                return _PRIOR_OVERHEAD, _PRIOR_SECONDS_PER_TOKEN
+            mean_x = sum(x for x, _ in self._samples) / n
+            mean_y = sum(y for _, y in self._samples) / n
+            var_x = sum((x - mean_x) ** 2 for x, _ in self._samples)
+            slope = 0.0
+            if var_x > 0:
+                slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in self._samples) / var_x)
+            self._fit = (max(0.0, mean_y - slope * mean_x), slope)
+        return self._fit
+
+    def predict(self, tokens: int) -> float:
+        with self._lock:
+            overhead, per_token = self._coefficients()
+        return overhead + per_token * tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            overhead, per_token = self._coefficients()
+            samples = len(self._samples)
+        return {
+            "samples": samples,
+            "overhead_seconds": round(overhead, 3),
+            "tokens_per_second": round(1 / per_token) if per_token > 0 else None,
+        }
+
+
+class ModelRouter:
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self.decisions = {}  # endpoint -> {model: times routed first}
+
+    def _model(self, name: str) -> LatencyModel:
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self._models[name] = LatencyModel()
+            return model
+
+    def observe(self, model: str, tokens: int, seconds: float):
+        self._model(model).observe(tokens, seconds)
+
+    def order(self, chain: list, tokens: int, endpoint: str = None, record: bool = True) -> list:
+        """
+        Reorders a priority chain so the best model for this call comes first.
+        record=False leaves the decision out of the routed_first counts (for a look-ahead).
+        """
+        if len(chain) < 2:
+            return chain
+        endpoint = endpoint or current_endpoint.get()
+        target = ROUTER_TARGETS.get(endpoint, ROUTER_TARGETS["default"])
+        predicted = {name: self._model(name).predict(tokens) for name in chain}
+        meeting = [name for name in chain if predicted[name] <= target]
+        if meeting:
+            first = min(meeting, key=lambda name: (ROUTER_MODEL_COSTS.get(name, 1.0), predicted[name]))
+        else:
+            first = min(chain, key=lambda name: predicted[name])
+        if record:
+            with self._lock:
+                counts = self.decisions.setdefault(endpoint, {})
+                counts[first] = counts.get(first, 0) + 1
+        return [first] + [name for name in chain if name != first]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            models = dict(self._models)
+            decisions = {endpoint: dict(counts) for endpoint, counts in self.decisions.items()}
+        return {
+            "targets": ROUTER_TARGETS,
+            "models": {name: model.snapshot() for name, model in models.items()},
+            "routed_first": decisions,
+        }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,175 @@
+"""
+Schemas for the JSON artifacts Gemini generates (MCQs, flashcards, study packs).
+
+Each ResponseSchema pairs a precompiled pydantic validator with the matching
+response schema sent to Gemini's structured output, so the model is
+constrained to the shape the API validates against. parse_json_reply turns a
+raw reply into validated plain data, repairing truncated replies locally
+before anyone has to pay for a re-generation.
+"""
+import json
+from typing import List
+
+from pydantic import BaseModel, TypeAdapter, field_validator, model_validator
+
+
+class MCQ(BaseModel):
+    question: str
+    options: List[str]
+    answer: int
+
+    @field_validator("options")
+    @classmethod
+    def _at_least_two_options(cls, options):
+        if len(options) < 2:
+            raise ValueError("a question needs at least two options")
+        return options
+
+    @model_validator(mode="after")
+    def _answer_in_range(self):
+        if not 0 <= self.answer < len(self.options):
+            raise ValueError("answer must index one of the options")
+        return self
+
+
+class Flashcard(BaseModel):
+    front: str
+    back: str
+
+
+class StudyPack(BaseModel):
+    summary: str
+    mcqs: List[MCQ]
+    flashcards: List[Flashcard]
+
+
+_MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}},
+        "answer": {"type": "integer"},
+    },
+    "required": ["question", "options", "answer"],
+}
+_FLASHCARD_SCHEMA = {
+    "type": "object",
+    "properties": {"front": {"type": "string"}, "back": {"type": "string"}},
+    "required": ["front", "back"],
+}
+
+
+class ResponseSchema:
+    """A validator plus the equivalent schema for Gemini's response_schema."""
+
+    def __init__(self, name: str, model, response_schema: dict, item_model=None):
+        self.name = name
+        self.adapter = TypeAdapter(model)
+        self.response_schema = response_schema
+        # For array schemas: validates one element, as produced by json_stream
+        self.item_adapter = TypeAdapter(item_model) if item_model is not None else None
+
+    def validate(self, text: str):
+        """Validates a JSON document and returns it as plain lists and dicts."""
+        return self.adapter.dump_python(self.adapter.validate_json(text))
+
+    def validate_item(self, text: str):
+        """Validates one array element and returns it as a plain dict."""
+        return self.item_adapter.dump_python(self.item_adapter.validate_json(text))
+
+
+MCQ_LIST = ResponseSchema("mcqs", List[MCQ], {"type": "array", "items": _MCQ_SCHEMA}, MCQ)
+FLASHCARD_LIST = ResponseSchema(
+    "flashcards", List[Flashcard], {"type": "array", "items": _FLASHCARD_SCHEMA}, Flashcard
+)
+STUDY_PACK = ResponseSchema("study_pack", StudyPack, {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "mcqs": {"type": "array", "items": _MCQ_SCHEMA},
+        "flashcards": {"type": "array", "items": _FLASHCARD_SCHEMA},
+    },
+    "required": ["summary", "mcqs", "flashcards"],
+})
+
+
+def strip_fences(text: str) -> str:
+    """Removes a Markdown code fence around a JSON reply, if the model added one."""
+    text = text.strip()
+    if text.startswith("```json"): text = text[7:]
+    elif text.startswith("```"): text = text[3:]
+    if text.endswith("```"): text = text[:-3]
+    return text.strip()
+
+
+def _repair(text: str, max_depth: int = None):
+    """
+    Cuts text after the last complete value closed with at most max_depth
+    containers still open, and closes those. Returns (repaired text or None,
+    number of containers closed).
+    """
+    stack, in_string, escaped = [], False, False
+    cut, cut_stack = None, None
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            stack.append("]" if char == "[" else "}")
+        elif char in "]}":
+            if not stack or stack.pop() != char:
+                return None, 0
+            # Everything up to here is a complete value inside the open containers
+            if max_depth is None or len(stack) <= max_depth:
+                cut, cut_stack = i + 1, list(stack)
+    if cut is None:
+        return None, 0
+    return text[:cut] + "".join(reversed(cut_stack)), len(cut_stack)
+
+
+def repair_truncated_json(text: str, max_depth: int = None):
+    """
+    Closes a JSON document that was cut off mid-generation (e.g. at the output
+    token limit): drops everything after the last complete object or array
+    (closed with at most max_depth containers still open) and closes the
+    brackets still open. Returns None if nothing is salvageable.
+    """
+    return _repair(text, max_depth)[0]
+
+
+def parse_json_reply(text: str, schema: ResponseSchema = None):
+    """
+    Parses (and, given a schema, validates) a JSON reply. A reply that fails
+    is repaired as if truncated and checked again. If the repaired value is
+    still invalid (e.g. an MCQ cut off before its "answer"), the cut moves one
+    level outwards at a time, down to the last complete top-level element.
+    ValueError if nothing valid is left.
+    """
+    text = strip_fences(text)
+    parse = schema.validate if schema is not None else json.loads
+    try:
+        return parse(text)
+    except ValueError as e:
+        tried, max_depth = {text}, None
+        while True:
+            repaired, depth = _repair(text, max_depth)
+            if repaired is None:
+                raise e
+            if repaired not in tried:
+                tried.add(repaired)
+                try:
+                    value = parse(repaired)
+                except ValueError:
+                    pass
+                else:
+                    print(f"Gemini JSON log: repaired a truncated {schema.name if schema else 'JSON'} reply")
+                    return value
+            if depth <= 1:
+                raise e
+            max_depth = depth - 1
@@ -0,0 +1,36 @@
+"""
+Single-flight coalescing for async generation calls.
+
+Concurrent callers asking for the same key share one upstream call: the
+first caller starts it, everyone else awaits the same task.
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, factory):
+        """Awaits factory() once per key; callers arriving mid-flight share the result."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            self.stats["leaders"] += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # Shield so one disconnecting client does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+generation_flight = SingleFlight()
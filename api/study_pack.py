@@ -0,0 +1,107 @@
+"""
+Study pack: summary, MCQs and flashcards for one document in one request.
+
+"single" mode asks for all three artifacts in one structured prompt, so the
+document is sent to (and tokenized by) Gemini once instead of three times.
+"concurrent" mode runs the three generations in parallel over one shared
+context; it is used for documents that need map-reduce summarization and
+for streaming, where each artifact is emitted as soon as it is ready.
+"""
+import asyncio
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    from .prompts import FLASHCARDS_INSTRUCTION, MCQ_INSTRUCTION, STUDY_PACK_INSTRUCTION, SUMMARIZE_INSTRUCTION
+    from .schemas import FLASHCARD_LIST, MCQ_LIST, STUDY_PACK
+    from .summarizer import prepare_summary_context
+    from .tokens import estimate_tokens, token_budget
+    from .utils import get_gemini_json_async, get_gemini_text_async, prime_response_cache
+except ImportError:
+    from prompts import FLASHCARDS_INSTRUCTION, MCQ_INSTRUCTION, STUDY_PACK_INSTRUCTION, SUMMARIZE_INSTRUCTION
+    from schemas import FLASHCARD_LIST, MCQ_LIST, STUDY_PACK
+    from summarizer import prepare_summary_context
+    from tokens import estimate_tokens, token_budget
+    from utils import get_gemini_json_async, get_gemini_text_async, prime_response_cache
+
+ARTIFACTS = {
+    "summary": ("text", SUMMARIZE_INSTRUCTION, None),
+    "mcqs": ("json", MCQ_INSTRUCTION, MCQ_LIST),
+    "flashcards": ("json", FLASHCARDS_INSTRUCTION, FLASHCARD_LIST),
+}
+
+
+def _three_call_tokens(context: str) -> int:
+    """Prompt tokens the dashboard's separate summarize/mcq/flashcards calls would send."""
+    return sum(estimate_tokens(context + instruction) for _, instruction, _ in ARTIFACTS.values())
+
+
+async def _generate_artifact(name: str, context: str, use_cache: bool):
+    kind, instruction, schema = ARTIFACTS[name]
+    started = time.perf_counter()
+    if kind == "text":
+        value = await get_gemini_text_async(context, instruction, use_cache)
+        if value.startswith("Error:"):
+            raise RuntimeError(value)
+    else:
+        value = await get_gemini_json_async(context, instruction, use_cache, schema)
+        if value is None:
+            raise RuntimeError(f"Failed to generate {name}")
+    return name, value, (time.perf_counter() - started) * 1000
+
+
+def _is_complete(pack) -> bool:
+    return (
+        isinstance(pack, dict)
+        and isinstance(pack.get("summary"), str)
+        and isinstance(pack.get("mcqs"), list)
+        and isinstance(pack.get("flashcards"), list)
+    )
+
+
+async def iter_study_pack(text: str, use_cache: bool = True, mode: str = "auto"):
+    """
+    Yields (artifact name, value) pairs as each artifact becomes available,
+    followed by ("stats", {...}) comparing the cost with the three-call flow.
+    """
+    started = time.perf_counter()
+    max_tokens = token_budget().input
+    context = await prepare_summary_context(text, use_cache, max_tokens)
+    if mode == "auto":
+        mode = "single" if estimate_tokens(text) <= max_tokens else "concurrent"
+
+    stats = {"mode": mode, "three_call_prompt_tokens": _three_call_tokens(context)}
+    pending = list(ARTIFACTS)
+    if mode == "single":
+        stats["prompt_tokens"] = estimate_tokens(context + STUDY_PACK_INSTRUCTION)
+        pack = await get_gemini_json_async(context, STUDY_PACK_INSTRUCTION, use_cache, STUDY_PACK)
+        if _is_complete(pack):
+            for name in pending:
+                # Later /api/summarize, /api/mcq and /api/flashcards calls become cache hits
+                kind, instruction, _ = ARTIFACTS[name]
+                await run_in_threadpool(
+                    prime_response_cache, kind, context, instruction, pack[name], STUDY_PACK_INSTRUCTION
+                )
+                yield name, pack[name]
+            pending = []
+        else:
+            stats["fallback"] = "concurrent"
+
+    if pending:
+        stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + _three_call_tokens(context)
+        call_ms = 0.0
+        for next_done in asyncio.as_completed([_generate_artifact(name, context, use_cache) for name in pending]):
+            name, value, elapsed_ms = await next_done
+            call_ms += elapsed_ms
+            yield name, value
+        # What the dashboard's one-after-another calls would have waited in total
+        stats["sequential_call_ms"] = round(call_ms, 1)
+
+    stats["saved_prompt_tokens"] = stats["three_call_prompt_tokens"] - stats["prompt_tokens"]
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    yield "stats", stats
+
+
+async def build_study_pack(text: str, use_cache: bool = True, mode: str = "auto") -> dict:
+    return {name: value async for name, value in iter_study_pack(text, use_cache, mode)}
@@ -0,0 +1,129 @@
+"""
+Map-reduce summarization for documents larger than one prompt.
+
+The text is split into chunks with content-defined boundaries, so editing one
+part of a document only changes the chunks around the edit. Chunks are
+summarized concurrently (each call goes through the response cache, so
+unchanged chunks are free on a re-request) and the partial summaries are
+reduced hierarchically until they fit in a single prompt.
+"""
+import asyncio
+import hashlib
+import os
+
+try:
+    from .tokens import chars_for_tokens, estimate_tokens, token_budget, uncalibrated_tokens
+    from .utils import get_gemini_text_async
+except ImportError:
+    from tokens import chars_for_tokens, estimate_tokens, token_budget, uncalibrated_tokens
+    from utils import get_gemini_text_async
+
+SUMMARY_MAX_PARALLEL = int(os.environ.get("SUMMARY_MAX_PARALLEL", "4"))
+
+# On average one paragraph in this many may end a chunk once it is half full
+_BOUNDARY_MODULUS = 4
+
+MAP_INSTRUCTION = (
+    "Summarize this section of a longer document. Keep every key concept, definition, "
+    "formula and example; use concise bullet points and bold key terms."
+)
+REDUCE_INSTRUCTION = (
+    "These are summaries of consecutive sections of one document. Merge them into a single "
+    "summary that keeps every key concept and removes repetition."
+)
+
+
+def _split_oversized(paragraph: str, max_chars: int) -> list:
+    """Splits a paragraph longer than max_chars at line, sentence or word breaks."""
+    pieces = []
+    while len(paragraph) > max_chars:
+        window = paragraph[:max_chars]
+        cut = max(window.rfind("\n"), window.rfind(". "), window.rfind(" "))
+        cut = cut + 1 if cut > max_chars // 2 else max_chars
+        pieces.append(paragraph[:cut])
+        paragraph = paragraph[cut:]
+    if paragraph:
+        pieces.append(paragraph)
+    return pieces
+
+
+def _is_boundary(paragraph: str) -> bool:
+    digest = hashlib.blake2b(paragraph.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "big") % _BOUNDARY_MODULUS == 0
+
+
+def split_into_chunks(text: str, max_tokens: int) -> list:
+    """
+    Packs paragraphs into chunks of at most max_tokens (converted to characters
+    at the text's own uncalibrated density, so chunks and their cached
+    summaries stay the same while the token estimator calibrates). Once a chunk is half full it ends at
+    a paragraph whose hash marks a boundary, so boundaries depend on local
+    content rather than on everything before them.
+    """
+    max_chars = chars_for_tokens(text, max_tokens)
+    paragraphs = []
+    for paragraph in text.split("\n\n"):
+        paragraphs.extend(_split_oversized(paragraph + "\n\n", max_chars))
+
+    chunks, current, size = [], [], 0
+    for paragraph in paragraphs:
+        if current and size + len(paragraph) > max_chars:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph)
+        if size >= max_chars // 2 and _is_boundary(paragraph):
+            chunks.append("".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("".join(current))
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+async def _summarize_all(parts: list, instruction: str, use_cache: bool) -> list:
+    """Summarizes parts concurrently, at most SUMMARY_MAX_PARALLEL at a time."""
+    semaphore = asyncio.Semaphore(SUMMARY_MAX_PARALLEL)
+
+    async def summarize_one(part):
+        async with semaphore:
+            summary = await get_gemini_text_async(part, instruction, use_cache)
+        if summary.startswith("Error:"):
+            raise RuntimeError(summary)
+        return summary
+
+    return await asyncio.gather(*(summarize_one(part) for part in parts))
+
+
+def _group(summaries: list, max_tokens: int) -> list:
+    """Concatenates consecutive summaries into groups that fit one prompt (uncalibrated, like the chunks)."""
+    groups, current = [], ""
+    for summary in summaries:
+        if current and uncalibrated_tokens(current + summary) > max_tokens:
+            groups.append(current)
+            current = ""
+        current += summary + "\n\n"
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def prepare_summary_context(text: str, use_cache: bool = True, max_tokens: int = None) -> str:
+    """
+    Returns a context within max_tokens (default: the current endpoint's input
+    budget): the text itself when it is short enough, otherwise the reduced
+    section summaries of the document.
+    """
+    max_tokens = max_tokens or token_budget().input
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    summaries = await _summarize_all(split_into_chunks(text, max_tokens), MAP_INSTRUCTION, use_cache)
+    groups = _group(summaries, max_tokens)
+    while len(groups) > 1:
+        summaries = await _summarize_all(groups, REDUCE_INSTRUCTION, use_cache)
+        regrouped = _group(summaries, max_tokens)
+        if len(regrouped) >= len(groups):
+            # Summaries are not shrinking; stop rather than loop forever
+            break
+        groups = regrouped
+    return "Section-by-section summaries of a long document:\n\n" + "\n\n".join(groups)
@@ -0,0 +1,152 @@
+"""
+Local token estimates and per-endpoint token budgets.
+
+estimate_tokens() never calls Gemini. It counts characters, adds weight for
+non-ASCII text (which tokenizes denser) by its extra UTF-8 bytes, and scales
+the result by a factor calibrated against the backend's count_tokens on the
+first TOKEN_CALIBRATION_SAMPLES real prompts. Calibration runs in the
+background, and exact counts are cached by content hash. Map-reduce cut
+points use the uncalibrated estimate so they do not move as the scale does.
+
+Each endpoint has a budget (TOKEN_BUDGETS). "input" caps the context tokens
+it sends, which decides when documents are map-reduced and how many chat
+passages fit. "output" is sent as max_output_tokens and reserved with the
+quota governor.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from .router import current_endpoint
+except ImportError:
+    from router import current_endpoint
+
+# Documents longer than this are map-reduced before summaries, MCQs, flashcards and study packs
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "24000"))
+# {"endpoint": {"input": context tokens, "output": reply tokens}}, merged over these defaults
+TOKEN_BUDGETS = {
+    "chat": {"input": 8000, "output": 1024},
+    "summarize": {"input": SUMMARY_CHUNK_TOKENS, "output": 2048},
+    "mcq": {"input": SUMMARY_CHUNK_TOKENS, "output": 4096},
+    "flashcards": {"input": SUMMARY_CHUNK_TOKENS, "output": 2048},
+    "study_pack": {"input": SUMMARY_CHUNK_TOKENS, "output": 8192},
+    "default": {"input": SUMMARY_CHUNK_TOKENS, "output": 2048},
+}
+for _endpoint, _budget in json.loads(os.environ.get("TOKEN_BUDGETS", "{}")).items():
+    TOKEN_BUDGETS[_endpoint] = {**TOKEN_BUDGETS.get(_endpoint, TOKEN_BUDGETS["default"]), **_budget}
+
+TOKEN_CALIBRATION_SAMPLES = int(os.environ.get("TOKEN_CALIBRATION_SAMPLES", "20"))
+# Shorter prompts say little about the ratio and are not worth a count_tokens call
+TOKEN_CALIBRATION_MIN_CHARS = int(os.environ.get("TOKEN_CALIBRATION_MIN_CHARS", "2000"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "1024"))
+
+# Uncalibrated guess for English prose, and extra tokens per extra UTF-8 byte of non-ASCII text
+CHARS_PER_TOKEN = 4.0
+_NON_ASCII_WEIGHT = 0.4
+
+
+class TokenBudget:
+    def __init__(self, input: int, output: int):
+        self.input = input
+        self.output = output
+
+
+def token_budget(endpoint: str = None) -> TokenBudget:
+    """The budget of endpoint, by default the one handling the current request."""
+    endpoint = endpoint or current_endpoint.get()
+    budget = TOKEN_BUDGETS.get(endpoint, TOKEN_BUDGETS["default"])
+    return TokenBudget(int(budget["input"]), int(budget["output"]))
+
+
+def _raw_estimate(text: str) -> float:
+    if text.isascii():
+        return len(text) / CHARS_PER_TOKEN
+    return len(text) / CHARS_PER_TOKEN + (len(text.encode("utf-8")) - len(text)) * _NON_ASCII_WEIGHT
+
+
+class TokenEstimator:
+    def __init__(self):
+        self.scale = 1.0
+        self.samples = 0
+        self._exact = OrderedDict()  # content digest -> exact token count
+        self._calibrating = False
+        self._lock = threading.Lock()
+        self.stats = {"exact_calls": 0, "exact_hits": 0, "calibration_errors": 0}
+
+    def estimate(self, text: str) -> int:
+        return int(_raw_estimate(text) * self.scale) + 1
+
+    def exact(self, text: str, backend) -> int:
+        """backend.count_tokens(text), cached by content."""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._exact.get(key)
+            if count is not None:
+                self._exact.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return count
+        count = backend.count_tokens(text)
+        with self._lock:
+            self.stats["exact_calls"] += 1
+            self._exact[key] = count
+            while len(self._exact) > TOKEN_CACHE_SIZE:
+                self._exact.popitem(last=False)
+        return count
+
+    def _calibrate(self, text: str, backend):
+        try:
+            ratio = self.exact(text, backend) / _raw_estimate(text)
+            with self._lock:
+                self.samples += 1
+                # Running mean over the calibration samples
+                self.scale += (ratio - self.scale) / self.samples
+        except Exception as e:
+            print(f"Token calibration log: count_tokens failed ({type(e).__name__}); keeping scale {self.scale:.3f}")
+            with self._lock:
+                self.stats["calibration_errors"] += 1
+        finally:
+            with self._lock:
+                self._calibrating = False
+
+    def observe(self, text: str, backend):
+        """Calibrates against this prompt in the background while samples are still needed."""
+        if self.samples >= TOKEN_CALIBRATION_SAMPLES or len(text) < TOKEN_CALIBRATION_MIN_CHARS:
+            return
+        with self._lock:
+            if self._calibrating or self.stats["calibration_errors"] >= TOKEN_CALIBRATION_SAMPLES:
+                return
+            self._calibrating = True
+        threading.Thread(target=self._calibrate, args=(text, backend), daemon=True).start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "scale": round(self.scale, 3),
+                "calibration_samples": self.samples,
+                "cached_counts": len(self._exact),
+                "budgets": TOKEN_BUDGETS,
+            }
+
+
+token_estimator = TokenEstimator()
+
+
+def estimate_tokens(text: str) -> int:
+    return token_estimator.estimate(text)
+
+
+def uncalibrated_tokens(text: str) -> int:
+    """
+    estimate_tokens() without the calibrated scale. Used where a cut point must
+    not move as calibration proceeds (map-reduce chunks are cached by content).
+    """
+    return int(_raw_estimate(text)) + 1
+
+
+def chars_for_tokens(text: str, tokens: int) -> int:
+    """How many characters of text make up about tokens tokens, at text's own uncalibrated density."""
+    return max(1, int(tokens * len(text) / uncalibrated_tokens(text)))
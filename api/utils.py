@@ -1,101 +1,702 @@
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
-import google.generativeai as genai
 import os
-
-print("🚀 BACKEND STARTING: AI Student Assistant API is loading...")
+import asyncio
+import contextlib
+import contextvars
+import functools
+import io
 import json
+import multiprocessing
 import typing
+import zipfile
+import xml.etree.ElementTree as ET
 import time
-import random
-import pypdf
-from docx import Document
-from dotenv import load_dotenv
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from .circuit_breaker import CLOSED, CircuitOpen, breakers
+    from .llm_backends import get_backend, is_model_not_found
+    from .json_stream import JsonArrayStream
+    from .quota import QuotaExceeded, is_quota_error, quota_governor, request_tokens
+    from .resilience import GENERATION_DEADLINE, RETRY_MAX_ATTEMPTS, backoff_delay, is_retryable, resilience
+    from .response_cache import cache_key, get_response_cache
+    from .router import model_router
+    from .schemas import ResponseSchema, parse_json_reply
+    from .singleflight import generation_flight
+    from .tokens import estimate_tokens, token_budget, token_estimator
+except ImportError:
+    from circuit_breaker import CLOSED, CircuitOpen, breakers
+    from llm_backends import get_backend, is_model_not_found
+    from json_stream import JsonArrayStream
+    from quota import QuotaExceeded, is_quota_error, quota_governor, request_tokens
+    from resilience import GENERATION_DEADLINE, RETRY_MAX_ATTEMPTS, backoff_delay, is_retryable, resilience
+    from response_cache import cache_key, get_response_cache
+    from router import model_router
+    from schemas import ResponseSchema, parse_json_reply
+    from singleflight import generation_flight
+    from tokens import estimate_tokens, token_budget, token_estimator
+
+# Blocking Gemini calls are offloaded to this pool so handlers never stall the event loop
+LLM_MAX_WORKERS = int(os.environ.get("LLM_MAX_WORKERS", "16"))
+
+# PDFs with at least this many pages are split across a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+# Generations per JSON request when a reply is invalid even after local repair
+JSON_MAX_ATTEMPTS = max(1, int(os.environ.get("JSON_MAX_ATTEMPTS", "2")))
+
+_executor_lock = threading.Lock()
+_llm_executor = None
+_pdf_pool = None
+# Models whose quota the async wrappers already reserved on the event loop for this call
+_prepaid_quota = contextvars.ContextVar("prepaid_quota", default=None)
+
+@contextlib.contextmanager
+def _open_binary(source):
+    """
+    Opens a document source for binary reading. Sources may be a path,
+    raw bytes, or a seekable binary file-like object (BytesIO,
+    SpooledTemporaryFile); file-like objects are rewound, not closed.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            yield f
+    elif isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    else:
+        source.seek(0)
+        yield source
+
+def iter_pdf_pages(source):
+    """Yields the text of each non-empty PDF page, one page at a time."""
+    import pypdf  # Imported on first upload, not on every cold start
+    with _open_binary(source) as f:
+        reader = pypdf.PdfReader(f)
+        for page in reader.pages:
+            content = page.extract_text()
+            if content:
+                yield content
+
+def _extract_pdf_range(source, start: int, stop: int) -> list:
+    """Worker task: text of pages [start, stop), empty string for blank pages."""
+    import pypdf
+    with _open_binary(source) as f:
+        reader = pypdf.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
 
-# Load environment variables
-load_dotenv()
+@contextlib.contextmanager
+def _worker_path(source):
+    """
+    A path worker processes can reopen. Paths are passed through; bytes and
+    file-like sources (a SpooledTemporaryFile's spill file has no usable name)
+    are copied once to a named temp file, deleted afterwards, so each shard
+    ships a short path over IPC instead of the whole document.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spill:
+        with _open_binary(source) as f:
+            shutil.copyfileobj(f, spill, 1024 * 1024)
+    try:
+        yield spill.name
+    finally:
+        os.unlink(spill.name)
 
-# Initialize Gemini Model
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _executor_lock:
+            if _pdf_pool is None:
+                # Forking a threaded server can copy locks held by other threads into the
+                # workers and deadlock them; forkserver (or spawn) starts them clean
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pdf_pool
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+def _drop_pdf_pool(pool: ProcessPoolExecutor):
+    """Forgets a broken pool so the next large PDF starts a fresh one."""
+    global _pdf_pool
+    with _executor_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
 
-def get_model():
+def extract_pdf_pages(source) -> list:
     """
-    Finds the best available model. 
-    Prioritizes 1.5-flash for speed and higher free-tier quotas.
+    Returns the text of every non-empty page in order.
+    Large PDFs are sharded into page ranges and extracted on a reusable
+    process pool; small files (or hosts without multiprocessing) run serially.
     """
+    import pypdf
+    with _open_binary(source) as f:
+        page_count = len(pypdf.PdfReader(f).pages)
+    if PDF_WORKERS < 2 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return list(iter_pdf_pages(source))
+
+    # A few shards per worker so one slow range does not leave the others idle
+    shard_size = max(1, -(-page_count // (PDF_WORKERS * 4)))
+    starts = range(0, page_count, shard_size)
+    pool = None
     try:
-        # Check available models for this specific key
-        available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-        
-        # Priority order to stay within stable quotas
-        priorities = [
-            "models/gemini-1.5-flash",
-            "models/gemini-1.5-flash-latest",
-            "models/gemini-pro"
-        ]
-        
-        for model_path in priorities:
-            if model_path in available_models:
-                return genai.GenerativeModel(model_path)
-        
-        # Fallback to whatever is available
-        return genai.GenerativeModel(available_models[0])
+        pool = _get_pdf_pool()
+        with _worker_path(source) as path:
+            shards = pool.map(
+                _extract_pdf_range,
+                [path] * len(starts),
+                starts,
+                [min(start + shard_size, page_count) for start in starts],
+            )
+            return [page for shard in shards for page in shard if page]
     except Exception as e:
-        print(f"Model selection log: {e}")
-        # Final hard-coded fallback
-        return genai.GenerativeModel("gemini-1.5-flash")
+        # e.g. serverless runtimes without /dev/shm cannot start worker processes
+        print(f"Parallel PDF extraction unavailable, falling back to serial: {e}")
+        if isinstance(e, BrokenProcessPool) and pool is not None:
+            _drop_pdf_pool(pool)
+        return list(iter_pdf_pages(source))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Parts that hold text besides the body; headers come first, notes last
+_DOCX_HEADER_PARTS = re.compile(r"^word/header\d*\.xml$")
+_DOCX_NOTE_PARTS = ("word/footnotes.xml", "word/endnotes.xml")
+# Legacy (VML) copy of content that mc:Choice already holds, e.g. every text box
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+def _iter_wordml_blocks(stream, keep_empty: bool):
+    """
+    Incrementally parses one WordprocessingML part and yields each paragraph's
+    text; a table row is yielded as one line with its cells joined by " | ".
+    Finished elements are cleared, so memory stays bounded by one block.
+    mc:Fallback subtrees are skipped so text boxes are not read twice.
+    """
+    paragraphs = []  # text runs of the open paragraphs (text boxes nest them)
+    rows = []        # cells of the open table rows (tables nest too)
+    cells = []       # paragraphs of the open table cells
+    fallbacks = 0    # depth of open mc:Fallback elements
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        tag = elem.tag
+        if tag == _MC_FALLBACK:
+            fallbacks += 1 if event == "start" else -1
+            if event == "end":
+                elem.clear()
+            continue
+        if fallbacks:
+            continue
+        if event == "start":
+            if tag == _W + "p":
+                paragraphs.append([])
+            elif tag == _W + "tr":
+                rows.append([])
+            elif tag == _W + "tc":
+                cells.append([])
+            continue
+
+        if tag == _W + "t" and paragraphs:
+            paragraphs[-1].append(elem.text or "")
+        elif tag == _W + "tab" and paragraphs:
+            paragraphs[-1].append("\t")
+        elif tag in (_W + "br", _W + "cr") and paragraphs:
+            paragraphs[-1].append("\n")
+        elif tag == _W + "p":
+            text = "".join(paragraphs.pop())
+            if cells:
+                if text:
+                    cells[-1].append(text)
+            elif text or keep_empty:
+                yield text
+            elem.clear()
+        elif tag == _W + "tc":
+            text = " ".join(cells.pop())
+            if rows:
+                rows[-1].append(text)
+        elif tag == _W + "tr":
+            line = " | ".join(rows.pop())
+            if cells:
+                # Nested table: its rows become part of the enclosing cell
+                cells[-1].append(line)
+            elif line.strip(" |"):
+                yield line
+            elem.clear()
+        elif tag == _W + "tbl":
+            elem.clear()
+
+def iter_docx_blocks(source):
+    """
+    Streams the text of a .docx straight from its zip container: headers,
+    then body paragraphs and table rows in document order, then footnotes
+    and endnotes.
+    """
+    with _open_binary(source) as f, zipfile.ZipFile(f) as archive:
+        names = archive.namelist()
+        parts = [(name, False) for name in sorted(names) if _DOCX_HEADER_PARTS.match(name)]
+        parts.append(("word/document.xml", True))
+        parts += [(name, False) for name in _DOCX_NOTE_PARTS if name in names]
+        for name, keep_empty in parts:
+            with archive.open(name) as stream:
+                yield from _iter_wordml_blocks(stream, keep_empty)
+
+def extract_sections(source, ext: str = None) -> list:
+    """
+    Extracts a document as a list of sections (one per PDF page, a single
+    section for other formats). Joining the sections gives extract_text().
 
-def extract_text(file_path: str) -> str:
-    if not os.path.exists(file_path): return ""
-    ext = os.path.splitext(file_path)[1].lower()
+    source is a file path, bytes, or a binary file-like object; ext is
+    required for the latter two and defaults to the path's extension.
+    """
+    if isinstance(source, str):
+        if not os.path.exists(source): return []
+        ext = ext or os.path.splitext(source)[1]
+    ext = (ext or "").lower()
     try:
         if ext in [".txt", ".md"]:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
+            with _open_binary(source) as f:
+                # TextIOWrapper gives the same newline handling as open(..., "r")
+                reader = io.TextIOWrapper(f, encoding="utf-8")
+                try:
+                    return [reader.read()]
+                finally:
+                    reader.detach()
         elif ext == ".pdf":
-            text = ""
-            with open(file_path, "rb") as f:
-                reader = pypdf.PdfReader(f)
-                for page in reader.pages:
-                    content = page.extract_text()
-                    if content: text += content + "\n"
-            return text
+            return [page + "\n" for page in extract_pdf_pages(source)]
         elif ext == ".docx":
-            doc = Document(file_path)
-            return "\n".join([para.text for para in doc.paragraphs])
-        return ""
+            return ["\n".join(iter_docx_blocks(source))]
+        return []
     except Exception as e:
         print(f"Extraction error: {e}")
-        return ""
+        return []
+
+def extract_text(source, ext: str = None) -> str:
+    return "".join(extract_sections(source, ext))
+
+def _text_prompt(context: str, instruction: str) -> str:
+    return f"DOCUMENT CONTEXT:\n{context}\n\nUSER INSTRUCTION:\n{instruction}"
 
-def get_gemini_text(context: str, instruction: str) -> str:
-    """Gets plain text from Gemini."""
+def _json_prompt(context: str, instruction: str) -> str:
+    return f"CONTEXT:\n{context}\n\nTASK: {instruction}\n\nIMPORTANT: Return ONLY valid JSON. No markdown blocks."
+
+def _should_fail_over(error: Exception) -> bool:
+    """Errors another model might not have: quota, open breaker, transient, model gone."""
+    return isinstance(error, (QuotaExceeded, CircuitOpen)) or is_retryable(error) or is_model_not_found(error)
+
+def _admit(breaker, model_name: str, tokens: int):
+    """
+    Checks the model's breaker, then waits for quota; runs before every
+    attempt. Quota an async caller already reserved (_prepay_quota) covers
+    that model's first attempt.
+    """
+    if not breaker.allow():
+        raise breaker.rejection()
+    prepaid = _prepaid_quota.get()
+    if prepaid is not None and model_name in prepaid:
+        prepaid.discard(model_name)
+        return
     try:
-        model = get_model()
-        full_prompt = f"DOCUMENT CONTEXT:\n{context}\n\nUSER INSTRUCTION:\n{instruction}"
-        response = model.generate_content(full_prompt)
-        return response.text.strip()
+        quota_governor.acquire(model_name, tokens)
+    except QuotaExceeded:
+        breaker.release()
+        raise
+
+def _record_outcome(breaker, error: Exception, seconds: float):
+    if is_quota_error(error):
+        breaker.release()
+    else:
+        # Only failures that reflect on the model count against it, not e.g. a bad request
+        breaker.record(not (is_retryable(error) or is_model_not_found(error)), seconds)
+
+def _generate_with(backend, model_name: str, prompt: str, response_schema: dict,
+                   prompt_tokens: int, output_tokens: int) -> str:
+    breaker = breakers.get(model_name)
+    tokens = request_tokens(prompt, output_tokens)
+
+    def call(timeout):
+        started = time.monotonic()
+        try:
+            result = backend.generate(prompt, response_schema, model_name, output_tokens, timeout)
+        except Exception as e:
+            _record_outcome(breaker, e, time.monotonic() - started)
+            if is_quota_error(e):
+                raise quota_governor.upstream_error(model_name, e) from e
+            raise
+        seconds = time.monotonic() - started
+        breaker.record(True, seconds)
+        model_router.observe(model_name, prompt_tokens, seconds)
+        return result
+
+    return resilience.call(
+        model_name, call,
+        admit=lambda: _admit(breaker, model_name, tokens),
+        admit_hedge=lambda: quota_governor.try_acquire(model_name, tokens),
+    )
+
+def _generate(backend, prompt: str, response_schema: dict = None) -> tuple:
+    """
+    One generation, returned as (reply, model that answered). Models are tried in backend.model_names() order, with
+    the model router's pick for this endpoint and prompt size moved to the
+    front (see router.py): one whose circuit breaker is open is skipped, and
+    quota, transient or not-found errors fail over to the next. Each model
+    call is admitted by the quota governor, retried and optionally hedged
+    (see resilience.py). The reply is capped at the endpoint's output budget.
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    output_tokens = token_budget().output
+    token_estimator.observe(prompt, backend)
+    last_error = None
+    for model_name in model_router.order(backend.model_names(), prompt_tokens):
+        try:
+            text = _generate_with(backend, model_name, prompt, response_schema, prompt_tokens, output_tokens)
+            return text, model_name
+        except Exception as e:
+            if not _should_fail_over(e):
+                raise
+            print(f"Failover log: {model_name} unavailable ({type(e).__name__}); trying the next model")
+            last_error = e
+    raise last_error
+
+def _cached_reply(backend, kind: str, instruction: str, context: str) -> tuple:
+    """
+    (cached reply, model that produced it), or (None, None). Replies are
+    cached under the model that answered, which routing and failover make
+    any model in the chain, so each one's entry is checked in turn.
+    """
+    cache = get_response_cache()
+    for model_name in backend.model_names():
+        cached = cache.get(cache_key(model_name, f"{kind}:" + instruction, context))
+        if cached is not None:
+            return cached, model_name
+    return None, None
+
+def get_gemini_text(context: str, instruction: str, use_cache: bool = True) -> str:
+    """
+    Gets plain text from Gemini. use_cache=False forces regeneration.
+    Failures come back as "Error: ..." strings, except QuotaExceeded and
+    CircuitOpen (every model unavailable), which are raised.
+    """
+    try:
+        backend = get_backend()
+        if use_cache:
+            cached, _ = _cached_reply(backend, "text", instruction, context)
+            if cached is not None:
+                return cached
+
+        text, model_name = _generate(backend, _text_prompt(context, instruction))
+        text = text.strip()
+        get_response_cache().set(cache_key(model_name, "text:" + instruction, context), text)
+        return text
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"Gemini Text Error: {e}")
         return f"Error: {str(e)}"
 
-def get_gemini_json(context: str, instruction: str) -> typing.Any:
-    """Gets JSON from Gemini."""
+def get_gemini_json(context: str, instruction: str, use_cache: bool = True,
+                    schema: ResponseSchema = None) -> typing.Any:
+    """
+    Gets JSON from Gemini. use_cache=False forces regeneration.
+
+    With a schema the reply is generated as structured output and validated
+    against it; a reply that stays invalid after local repair is regenerated
+    up to JSON_MAX_ATTEMPTS times in total. Returns None on failure; raises
+    QuotaExceeded or CircuitOpen when no model can take the call.
+    """
     try:
-        model = get_model()
-        full_prompt = f"CONTEXT:\n{context}\n\nTASK: {instruction}\n\nIMPORTANT: Return ONLY valid JSON. No markdown blocks."
-        response = model.generate_content(full_prompt)
-        text = response.text.strip()
-        
-        # Clean up Markdown JSON blocks if AI adds them
-        if text.startswith("```json"): text = text[7:]
-        elif text.startswith("```"): text = text[3:]
-        if text.endswith("```"): text = text[:-3]
-        
-        return json.loads(text.strip())
+        backend = get_backend()
+        if use_cache:
+            cached, _ = _cached_reply(backend, "json", instruction, context)
+            if cached is not None:
+                return json.loads(cached)
+
+        full_prompt = _json_prompt(context, instruction)
+        response_schema = schema.response_schema if schema is not None else None
+        for attempt in range(1, JSON_MAX_ATTEMPTS + 1):
+            text, model_name = _generate(backend, full_prompt, response_schema)
+            try:
+                result = parse_json_reply(text, schema)
+                break
+            except ValueError as e:
+                if attempt == JSON_MAX_ATTEMPTS:
+                    raise
+                print(f"Gemini JSON log: invalid reply ({e.__class__.__name__}); regenerating")
+        get_response_cache().set(cache_key(model_name, "json:" + instruction, context), json.dumps(result))
+        return result
+    except (QuotaExceeded, CircuitOpen):
+        raise
     except Exception as e:
         print(f"Gemini JSON Error: {e}")
         return None
+
+def prime_response_cache(kind: str, context: str, instruction: str, value: typing.Any, source_instruction: str):
+    """
+    Stores a result as if get_gemini_text ("text") or get_gemini_json ("json")
+    had produced it, under the model whose cached JSON reply to
+    source_instruction (on the same context) it was taken from.
+    """
+    backend = get_backend()
+    _, model_name = _cached_reply(backend, "json", source_instruction, context)
+    key = cache_key(model_name or backend.model_name, f"{kind}:" + instruction, context)
+    get_response_cache().set(key, value if kind == "text" else json.dumps(value))
+
+def _get_llm_executor() -> ThreadPoolExecutor:
+    global _llm_executor
+    if _llm_executor is None:
+        with _executor_lock:
+            if _llm_executor is None:
+                _llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS, thread_name_prefix="llm")
+    return _llm_executor
+
+async def _run_blocking(func, *args, **kwargs):
+    """Runs a blocking call on the bounded LLM pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables over; the router needs the endpoint
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_llm_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+async def _prepay_quota(prompt: str, kind: str, context: str, instruction: str, use_cache: bool):
+    """
+    Reserves quota for the model the call will try first, waiting on the
+    event loop rather than in an LLM pool thread: a burst that has to queue
+    for quota leaves the pool free for cache hits and other models, and a
+    full wait queue is rejected before any pool thread is taken. A model
+    that rejects the call fails over to the next, as in _generate. Nothing
+    is reserved when the reply is already cached.
+    """
+    backend = get_backend()
+
+    def chain_unless_cached():
+        # A short hop to the pool: resolving Gemini models may hit the network and the cache reads SQLite
+        if use_cache and _cached_reply(backend, kind, instruction, context)[0] is not None:
+            return None
+        return backend.model_names()
+
+    chain = await _run_blocking(chain_unless_cached)
+    if chain is None:
+        return
+    tokens = request_tokens(prompt, token_budget().output)
+    last_error, probing = None, False
+    # Same order as _generate; models whose breaker is not closed are left to it
+    for model_name in model_router.order(chain, estimate_tokens(prompt), record=False):
+        if breakers.get(model_name).state != CLOSED:
+            probing = True
+            continue
+        try:
+            await quota_governor.acquire_async(model_name, tokens)
+        except QuotaExceeded as e:
+            last_error = e
+            continue
+        _prepaid_quota.set({model_name})
+        return
+    if last_error is not None and not probing:
+        raise last_error
+
+async def get_gemini_text_async(context: str, instruction: str, use_cache: bool = True) -> str:
+    """Async variant of get_gemini_text; identical concurrent calls share one upstream request."""
+    key = cache_key(f"text:{use_cache}", instruction, context)
+
+    async def lead():
+        await _prepay_quota(_text_prompt(context, instruction), "text", context, instruction, use_cache)
+        return await _run_blocking(get_gemini_text, context, instruction, use_cache)
+
+    return await generation_flight.do(key, lead)
+
+async def get_gemini_json_async(context: str, instruction: str, use_cache: bool = True,
+                                schema: ResponseSchema = None) -> typing.Any:
+    """Async variant of get_gemini_json; identical concurrent calls share one upstream request."""
+    key = cache_key(f"json:{use_cache}", instruction, context)
+
+    async def lead():
+        await _prepay_quota(_json_prompt(context, instruction), "json", context, instruction, use_cache)
+        return await _run_blocking(get_gemini_json, context, instruction, use_cache, schema)
+
+    return await generation_flight.do(key, lead)
+
+async def _iterate_in_thread(make_iterator):
+    """
+    Drives a blocking iterator on the LLM pool and yields its items asynchronously.
+    When the consumer stops early the iterator is closed at the next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    finished = object()
+
+    def publish(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # Event loop already closed; nobody is listening any more
+            cancelled.set()
+
+    def produce():
+        iterator, error = None, None
+        try:
+            # Created in here so a stream() that raises before yielding still ends the consumer's wait
+            iterator = iter(make_iterator())
+            for item in iterator:
+                if cancelled.is_set():
+                    break
+                publish(item)
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    error = error or e
+            publish(finished, error)
+
+    loop.run_in_executor(_get_llm_executor(), produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is finished:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        cancelled.set()
+
+async def _stream_from(backend, model_name: str, prompt: str, response_schema: dict = None):
+    """
+    Streams from one model, admitted by its breaker and the quota governor.
+    Transient errors are retried until the first chunk has been yielded.
+    """
+    breaker = breakers.get(model_name)
+    prompt_tokens = estimate_tokens(prompt)
+    output_tokens = token_budget().output
+    tokens = request_tokens(prompt, output_tokens)
+    deadline = time.monotonic() + GENERATION_DEADLINE
+    attempt = 1
+    while True:
+        if not breaker.allow():
+            raise breaker.rejection()
+        recorded = False
+        try:
+            await quota_governor.acquire_async(model_name, tokens)
+            started_at = time.monotonic()
+            timeout = deadline - started_at
+            if timeout <= 0:
+                raise TimeoutError(f"Generation deadline of {GENERATION_DEADLINE:.0f}s passed")
+            chunks = _iterate_in_thread(
+                lambda: backend.stream(prompt, response_schema, model_name, output_tokens, timeout)
+            )
+            started = False
+            try:
+                async for chunk in chunks:
+                    if not started:
+                        # Time to first chunk is what the breaker judges a stream by
+                        breaker.record(True, time.monotonic() - started_at)
+                        started = recorded = True
+                    yield chunk
+                model_router.observe(model_name, prompt_tokens, time.monotonic() - started_at)
+                return
+            except Exception as e:
+                if not started:
+                    _record_outcome(breaker, e, time.monotonic() - started_at)
+                    recorded = True
+                if is_quota_error(e):
+                    raise quota_governor.upstream_error(model_name, e) from e
+                delay = backoff_delay(attempt)
+                if (started or not is_retryable(e) or attempt >= RETRY_MAX_ATTEMPTS
+                        or time.monotonic() + delay > deadline):
+                    raise
+                print(f"Retry log: {type(e).__name__} from {model_name} stream; attempt {attempt + 1} in {delay:.2f}s")
+                resilience.count("retries")
+            finally:
+                await chunks.aclose()
+        finally:
+            if not recorded:
+                # Quota rejection or cancellation (e.g. the client left before the first chunk):
+                # nothing was learned about the model, so a half-open probe slot is handed back
+                breaker.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _stream(backend, prompt: str, response_schema: dict = None):
+    """
+    Streams one generation as (model, chunk) pairs, failing over along the
+    routed model chain until a chunk arrives.
+    """
+    token_estimator.observe(prompt, backend)
+    last_error = None
+    for model_name in model_router.order(backend.model_names(), estimate_tokens(prompt)):
+        started = False
+        chunks = _stream_from(backend, model_name, prompt, response_schema)
+        try:
+            async for chunk in chunks:
+                started = True
+                yield model_name, chunk
+            return
+        except Exception as e:
+            if started or not _should_fail_over(e):
+                raise
+            print(f"Failover log: {model_name} unavailable ({type(e).__name__}); trying the next model")
+            last_error = e
+        finally:
+            await chunks.aclose()
+    raise last_error
+
+async def stream_gemini_text(context: str, instruction: str, use_cache: bool = True):
+    """Yields a plain-text answer chunk by chunk; the full answer is cached once complete."""
+    backend = get_backend()
+    if use_cache:
+        # Resolving the Gemini models may hit the network, so keep the lookup off the event loop
+        cached, _ = await _run_blocking(_cached_reply, backend, "text", instruction, context)
+        if cached is not None:
+            yield cached
+            return
+
+    chunks = []
+    async for model_name, chunk in _stream(backend, _text_prompt(context, instruction)):
+        chunks.append(chunk)
+        yield chunk
+    get_response_cache().set(cache_key(model_name, "text:" + instruction, context), "".join(chunks).strip())
+
+async def stream_gemini_json_items(context: str, instruction: str, schema: ResponseSchema, use_cache: bool = True):
+    """
+    Yields the validated elements of a JSON array reply as each one closes in
+    the Gemini stream. Elements that fail validation are skipped, and a
+    truncated last element is dropped; the list is only cached when neither
+    happened, since /api/mcq and /api/flashcards read the same cache entry.
+    """
+    backend = get_backend()
+    if use_cache:
+        cached, _ = await _run_blocking(_cached_reply, backend, "json", instruction, context)
+        if cached is not None:
+            for item in json.loads(cached):
+                yield item
+            return
+
+    parser = JsonArrayStream()
+    prompt = _json_prompt(context, instruction)
+    chunks, items, skipped = [], [], 0
+    model_name = None
+    async for model_name, chunk in _stream(backend, prompt, schema.response_schema):
+        chunks.append(chunk)
+        for raw in parser.feed(chunk):
+            try:
+                item = schema.validate_item(raw)
+            except ValueError as e:
+                print(f"Gemini JSON log: skipped an invalid {schema.name} element ({e.__class__.__name__})")
+                skipped += 1
+                continue
+            items.append(item)
+            yield item
+
+    if not items:
+        # Nothing valid streamed: parse the whole reply so a malformed one raises instead of caching []
+        for item in parse_json_reply("".join(chunks), schema):
+            items.append(item)
+            yield item
+    if skipped or not parser.closed:
+        print(f"Gemini JSON log: not caching a partial {schema.name} list ({len(items)} items)")
+        return
+    get_response_cache().set(cache_key(model_name, "json:" + instruction, context), json.dumps(items))